@@ -0,0 +1,142 @@
+"""
+End to end crawl throughput against benchmarks.fake_cache, without the
+spacetime cache server. Each thread count crawls the whole synthetic web
+in a fresh forked process, with a fresh save file, and reports:
+
+- pages/sec: downloads per second of wall time,
+- CPU: user + system seconds of the crawl (parse processes included) and
+  as a share of one core,
+- peak RSS of the crawl process,
+- frontier lock contention: mean and p99 wait per acquisition and the
+  total time spent waiting, from the metrics of the crawl.
+
+    python -m benchmarks.crawl_speed --threads 1,2,4,8 --pages 2000
+
+Crawler settings come from --config_file (config.ini by default) with
+SAVE, THREADCOUNT, POLITENESS and SEEDURL replaced for the run, so other
+settings such as FETCHMODE or PARSEPROCESSES are benchmarked as configured.
+"""
+import logging
+import multiprocessing
+import os
+import resource
+import shutil
+import tempfile
+import time
+from argparse import ArgumentParser
+from configparser import ConfigParser
+
+from benchmarks.fake_cache import (
+    FakeCacheServer, add_web_arguments, web_from_args)
+
+
+def crawl(config_file, overrides, cache_server, directory, results):
+    """Run one crawl in this (forked) process and put its numbers in results."""
+    os.chdir(directory)
+    # The per url log lines would dominate the run.
+    logging.disable(logging.INFO)
+
+    from crawler import Crawler
+    from crawler.async_worker import AsyncWorker
+    from utils.config import Config
+    from utils.metrics import metrics, quantile, BUCKETS
+    import scraper
+
+    cparser = ConfigParser()
+    cparser.read(config_file)
+    for section, values in overrides.items():
+        for key, value in values.items():
+            cparser[section][key] = value
+    config = Config(cparser)
+    config.cache_server = cache_server
+    worker_factory = None
+    if config.fetch_mode == "async":
+        worker_factory = AsyncWorker
+
+    start = time.perf_counter()
+    cpu_start = os.times()
+    kwargs = {"worker_factory": worker_factory} if worker_factory else {}
+    crawler = Crawler(config, True, **kwargs)
+    crawler.start()
+    scraper.create_report()
+    elapsed = time.perf_counter() - start
+    cpu_end = os.times()
+
+    counters = metrics.counters()
+    lock_wait = metrics.histograms().get("frontier_lock_wait")
+    waits = sum(lock_wait[:BUCKETS]) if lock_wait else 0
+    results.put({
+        "pages": counters.get(("pages",), 0),
+        "unique": len(scraper.stats.unique_pages),
+        "seconds": elapsed,
+        "cpu": sum(cpu_end[:4]) - sum(cpu_start[:4]),
+        "rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "lock_waits": waits,
+        "lock_p99": quantile(lock_wait, 0.99) if waits else 0.0,
+        "lock_wait_seconds": lock_wait[BUCKETS] if lock_wait else 0.0,
+        "lock_sample": config.metrics_sample,
+    })
+
+
+def run(config_file, threads, politeness, server, web):
+    host, port = server.address
+    overrides = {
+        "LOCAL PROPERTIES": {
+            "SAVE": "frontier.shelve",
+            "THREADCOUNT": str(threads),
+            "METRICSINTERVAL": "0",
+            "METRICSPORT": "0",
+            "METRICSSAMPLE": "1"},
+        "CRAWLER": {
+            "POLITENESS": str(politeness),
+            "SEEDURL": ",".join(web.seeds())},
+    }
+    directory = tempfile.mkdtemp(prefix="crawl_speed_")
+    results = multiprocessing.Queue()
+    try:
+        process = multiprocessing.Process(
+            target=crawl, args=(
+                os.path.abspath(config_file), overrides, (host, port),
+                directory, results))
+        process.start()
+        result = results.get()
+        process.join()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return result
+
+
+def main(args):
+    multiprocessing.set_start_method("fork", force=True)
+    web = web_from_args(args)
+    server = FakeCacheServer(web, args.latency).start()
+    print(f"{web.pages} pages on {web.hosts} hosts, fan-out {web.fan_out}, "
+          f"latency {args.latency * 1000:.1f}ms, "
+          f"politeness {args.politeness}s")
+    print(f"{'threads':>7} {'pages':>6} {'unique':>6} {'seconds':>8} "
+          f"{'pages/s':>8} {'cpu s':>7} {'cpu %':>6} {'rss MiB':>8} "
+          f"{'lock avg':>9} {'lock p99':>9} {'lock tot':>9}")
+    try:
+        for threads in args.threads:
+            r = run(args.config_file, threads, args.politeness, server, web)
+            average = (r["lock_wait_seconds"] / r["lock_waits"]
+                       if r["lock_waits"] else 0)
+            print(f"{threads:>7} {r['pages']:>6} {r['unique']:>6} "
+                  f"{r['seconds']:>8.2f} {r['pages'] / r['seconds']:>8.1f} "
+                  f"{r['cpu']:>7.2f} {100 * r['cpu'] / r['seconds']:>6.0f} "
+                  f"{r['rss']:>8.1f} {average * 1e6:>7.1f}us "
+                  f"{r['lock_p99'] * 1e6:>7.1f}us "
+                  f"{r['lock_wait_seconds'] * r['lock_sample']:>8.3f}s")
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    add_web_arguments(parser)
+    parser.add_argument("--threads", type=lambda s: [
+        int(n) for n in s.split(",")], default=[1, 2, 4, 8])
+    parser.add_argument("--politeness", type=float, default=0.0,
+                        help="POLITENESS for the run, in seconds")
+    parser.add_argument("--config_file", type=str, default="config.ini")
+    main(parser.parse_args())
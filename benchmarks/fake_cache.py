@@ -0,0 +1,244 @@
+"""
+A local stand-in for the spacetime cache server, serving a synthetic web
+graph, so the crawler can run end to end without registering with
+styx.ics.uci.edu.
+
+It speaks the protocol utils.download expects: GET /?q=<url>&u=<agent>
+returns a cbor map with "url", "status" and, for pages that exist, a
+pickled "response" object with .url and .content.
+
+    python -m benchmarks.fake_cache --pages 5000 --port 9000
+
+serves until interrupted; benchmarks.crawl_speed starts one itself.
+"""
+import pickle
+import random
+import threading
+import time
+from argparse import ArgumentParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+import cbor
+
+WORDS = (
+    "research student faculty course lecture seminar project paper data "
+    "machine learning system network security theory algorithm graph "
+    "database software design human computer interaction vision language "
+    "model robot privacy cloud compiler program analysis statistics "
+    "probability inference bayesian optimization distributed parallel "
+    "hardware architecture quantum informatics health game music art "
+    "education community event news award grant lab group alumni").split()
+
+
+def _slug(page):
+    """Page number in base 26 letters: 0 -> 'a', 27 -> 'bb'."""
+    letters = ""
+    while True:
+        page, digit = divmod(page, 26)
+        letters = chr(ord("a") + digit) + letters
+        if not page:
+            return letters
+
+
+def _page(slug):
+    if not slug.isalpha() or not slug.islower():
+        raise ValueError(slug)
+    page = 0
+    for letter in slug:
+        page = page * 26 + ord(letter) - ord("a")
+    return page
+
+
+class RawResponse(object):
+    """What the cache server pickles into "response"."""
+    def __init__(self, url, content):
+        self.url = url
+        self.content = content
+
+
+class SyntheticWeb(object):
+    """
+    `pages` pages spread over `hosts` subdomains of ics.uci.edu, each
+    linking to `fan_out` random pages. Everything is derived from the page
+    number, so the graph is the same on every run with the same seed.
+
+    - A `traps` fraction of pages also links into an endless calendar
+      (/calendar/<slug>/<n> links to /calendar/<slug>/<n + 1>).
+    - A `duplicates` fraction of pages serve the exact bytes of another
+      page, and a `near_duplicates` fraction serve another page with one
+      word changed.
+    - Links to unknown urls answer 404.
+    """
+    def __init__(self, pages=2000, fan_out=8, hosts=8, traps=0.02,
+                 duplicates=0.05, near_duplicates=0.05, words=300, seed=0):
+        self.pages = pages
+        self.fan_out = fan_out
+        self.hosts = hosts
+        self.traps = traps
+        self.duplicates = duplicates
+        self.near_duplicates = near_duplicates
+        self.words = words
+        self.seed = seed
+
+    def url(self, page):
+        # No digits in page paths: the frontier caps urls per path pattern
+        # with digits replaced, which should only catch the calendars.
+        return (f"https://h{page % self.hosts}.ics.uci.edu/"
+                f"{WORDS[page % len(WORDS)]}/{_slug(page)}")
+
+    def seeds(self):
+        return [self.url(page) for page in range(min(self.hosts, self.pages))]
+
+    def _random(self, page):
+        return random.Random(self.seed * 1000003 + page)
+
+    def _html(self, page, changed_word=None):
+        rng = self._random(page)
+        words = [rng.choice(WORDS) for _ in range(self.words)]
+        if changed_word is not None:
+            words[len(words) // 2] = changed_word
+        links = [self.url(rng.randrange(self.pages))
+                 for _ in range(self.fan_out)]
+        if rng.random() < self.traps:
+            links.append(f"https://h{page % self.hosts}.ics.uci.edu"
+                         f"/calendar/{_slug(page)}/1")
+        anchors = "".join(f'<a href="{link}">{link}</a>\n' for link in links)
+        return (f"<html><head><title>Page {page}</title></head><body>\n"
+                f"<p>{' '.join(words)}</p>\n{anchors}</body></html>"
+                ).encode("utf-8")
+
+    def _calendar(self, host, slug, day):
+        return (f"<html><body><p>Events of day {day}</p>"
+                f'<a href="https://{host}/calendar/{slug}/{day + 1}">next</a>'
+                f"</body></html>").encode("utf-8")
+
+    def content(self, url):
+        """The bytes served for `url`, or None for a 404."""
+        parsed = urlsplit(url)
+        parts = parsed.path.strip("/").split("/")
+        try:
+            if len(parts) == 3 and parts[0] == "calendar":
+                return self._calendar(parsed.netloc, parts[1], int(parts[2]))
+            if len(parts) == 2:
+                page = _page(parts[1])
+                if not 0 <= page < self.pages or url != self.url(page):
+                    return None
+                roll = self._random(-page - 1).random()
+                if page and roll < self.duplicates:
+                    return self._html(page // 2)
+                if page and roll < self.duplicates + self.near_duplicates:
+                    return self._html(page // 2, changed_word=f"p{page}")
+                return self._html(page)
+        except ValueError:
+            pass
+        return None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real cache server
+    # Headers and body go out in separate writes; with Nagle's algorithm the
+    # body waits for the client's delayed ACK, about 40 ms per request.
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        query = parse_qs(urlsplit(self.path).query)
+        url = query.get("q", [""])[0]
+        server = self.server
+        if server.latency:
+            time.sleep(random.uniform(0, 2 * server.latency))
+        content = server.web.content(url)
+        if content is None:
+            reply = {"url": url, "status": 404, "error": "Not found"}
+        else:
+            reply = {"url": url, "status": 200,
+                     "response": pickle.dumps(RawResponse(url, content))}
+        body = cbor.dumps(reply)
+        with server.lock:
+            server.requests += 1
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeCacheServer(object):
+    """
+    Serves `web` on 127.0.0.1:`port` (0 picks a free port) from a daemon
+    thread, waiting on average `latency` seconds per request.
+    """
+    def __init__(self, web, latency=0.0, port=0):
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+        self.server.daemon_threads = True
+        self.server.web = web
+        self.server.latency = latency
+        self.server.lock = threading.Lock()
+        self.server.requests = 0
+        self.thread = None
+
+    @property
+    def address(self):
+        return self.server.server_address[:2]
+
+    @property
+    def requests(self):
+        return self.server.requests
+
+    def start(self):
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def add_web_arguments(parser):
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--fan-out", type=int, default=8)
+    parser.add_argument("--hosts", type=int, default=8)
+    parser.add_argument("--traps", type=float, default=0.02,
+                        help="fraction of pages linking into a calendar trap")
+    parser.add_argument("--duplicates", type=float, default=0.05,
+                        help="fraction of pages that are exact duplicates")
+    parser.add_argument("--near-duplicates", type=float, default=0.05,
+                        help="fraction of pages that are near duplicates")
+    parser.add_argument("--latency", type=float, default=0.005,
+                        help="mean seconds the server waits per request")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def web_from_args(args):
+    return SyntheticWeb(
+        pages=args.pages, fan_out=args.fan_out, hosts=args.hosts,
+        traps=args.traps, duplicates=args.duplicates,
+        near_duplicates=args.near_duplicates, seed=args.seed)
+
+
+def main():
+    parser = ArgumentParser()
+    add_web_arguments(parser)
+    parser.add_argument("--port", type=int, default=9000)
+    args = parser.parse_args()
+    server = FakeCacheServer(
+        web_from_args(args), args.latency, args.port).start()
+    host, port = server.address
+    print(f"Serving {args.pages} pages on {host}:{port}; seeds:")
+    for url in server.server.web.seeds():
+        print(f"  {url}")
+    try:
+        server.thread.join()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    # Run the imported module, so pickled responses refer to
+    # benchmarks.fake_cache.RawResponse rather than __main__.
+    from benchmarks.fake_cache import main as run
+    run()
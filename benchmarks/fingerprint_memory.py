@@ -0,0 +1,55 @@
+"""
+Bytes per url of the frontier's seen set: a set of get_urlhash hex strings
+against FingerprintSet at 8 and 16 byte digests.
+
+    python -m benchmarks.fingerprint_memory --urls 1000000
+"""
+import time
+import tracemalloc
+from argparse import ArgumentParser
+
+from utils import get_urlhash
+from utils.fingerprint import FingerprintSet, url_fingerprint
+
+
+def synthetic_urls(count):
+    for i in range(count):
+        yield f"https://www.ics.uci.edu/~user{i % 997}/pages/{i}.html?id={i}"
+
+
+def measure(name, build, count):
+    tracemalloc.start()
+    start = time.perf_counter()
+    seen = build(synthetic_urls(count))
+    elapsed = time.perf_counter() - start
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(seen) == count
+    print(f"{name:<22} {used / count:8.1f} bytes/url "
+          f"{count / elapsed:12,.0f} urls/sec")
+
+
+def hex_set(urls):
+    return {get_urlhash(url) for url in urls}
+
+
+def fingerprint_set(size):
+    def build(urls):
+        seen = FingerprintSet(size)
+        for url in urls:
+            seen.add(url_fingerprint(url, size))
+        return seen
+    return build
+
+
+def main(count):
+    measure("set of sha256 hex", hex_set, count)
+    measure("FingerprintSet(8)", fingerprint_set(8), count)
+    measure("FingerprintSet(16)", fingerprint_set(16), count)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--urls", type=int, default=1000000)
+    args = parser.parse_args()
+    main(args.urls)
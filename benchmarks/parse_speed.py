@@ -0,0 +1,77 @@
+"""
+Pages/sec of the page parse step: the previous two BeautifulSoup passes
+(count_words + extract_next_links) against the single html_scan pass, over a
+directory of saved pages (*.html, *.htm).
+
+    python -m benchmarks.parse_speed --corpus path/to/ics_pages
+
+Also reports how many pages produced the same links and word counts under
+both parsers. BeautifulSoup is only needed to run the "before" side.
+"""
+import os
+import re
+import time
+from argparse import ArgumentParser
+from collections import Counter
+from urllib.parse import urljoin, urldefrag
+
+from scraper import parse_page, stop_words
+
+
+def load_corpus(path):
+    pages = list()
+    for root, _, files in os.walk(path):
+        for name in sorted(files):
+            if name.endswith((".html", ".htm")):
+                with open(os.path.join(root, name), "rb") as f:
+                    pages.append((f"https://www.ics.uci.edu/{name}", f.read()))
+    return pages
+
+
+def two_pass_parse(url, content):
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(content, "html.parser")
+    for script in soup(["script", "style"]):
+        script.decompose()
+    text = " ".join(soup.stripped_strings)
+    words = [
+        w.lower()
+        for w in re.findall(r"\b\w+\b", text)
+        if w.lower() not in stop_words and len(w) > 1
+    ]
+    links = list()
+    soup = BeautifulSoup(content, "html.parser")
+    for tag in soup.find_all("a", href=True):
+        links.append(urldefrag(urljoin(url, tag["href"]))[0])
+    return links, Counter(words), len(words)
+
+
+def run(name, parse, pages):
+    start = time.perf_counter()
+    results = [parse(url, content) for url, content in pages]
+    elapsed = time.perf_counter() - start
+    size = sum(len(content) for _, content in pages) / 2 ** 20
+    print(f"{name:<12} {len(pages) / elapsed:10.1f} pages/sec "
+          f"{size / elapsed:8.2f} MiB/sec")
+    return results
+
+
+def main(corpus):
+    pages = load_corpus(corpus)
+    if not pages:
+        raise SystemExit(f"No .html pages found under {corpus}")
+    print(f"{len(pages)} pages, "
+          f"{sum(len(c) for _, c in pages) / 2 ** 20:.1f} MiB")
+    before = run("bs4 x2", two_pass_parse, pages)
+    after = run("html_scan", parse_page, pages)
+    same = sum(
+        old[0] == new[0] and old[1] == new[1]
+        for old, new in zip(before, after))
+    print(f"identical links and word counts on {same}/{len(pages)} pages")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--corpus", required=True)
+    args = parser.parse_args()
+    main(args.corpus)
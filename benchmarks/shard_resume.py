@@ -0,0 +1,151 @@
+"""
+Checks that interrupting a crawl loses no urls: crawls the synthetic web of
+benchmarks.fake_cache once without interruption, then again with Ctrl-C
+(SIGINT to the whole process group, as a terminal sends it) every
+--interrupt seconds for --interrupts times, resuming after each, and
+compares the urls completed in the save files of both.
+
+    python -m benchmarks.shard_resume --processes 2 --pages 1500
+
+The web defaults to a fan-out of 2: with more links per page, a url whose
+links were lost is usually found again through another page.
+
+Crawler settings come from --config_file (config.ini by default) with SAVE,
+PROCESSES, THREADCOUNT, POLITENESS and SEEDURL replaced for the run, and
+NEARDUPCAPACITY = 0: which of two random pages SimHash finds a near
+duplicate of the other depends on the order they are fetched in, and so
+would the urls reached. Exits with status 1 if the completed urls differ.
+"""
+import copy
+import logging
+import multiprocessing
+import os
+import shutil
+import signal
+import sys
+import tempfile
+from argparse import ArgumentParser
+from configparser import ConfigParser
+
+from benchmarks.fake_cache import (
+    FakeCacheServer, add_web_arguments, web_from_args)
+
+
+def _config(config_file, overrides):
+    from utils.config import Config
+    cparser = ConfigParser()
+    cparser.read(config_file)
+    for section, values in overrides.items():
+        for key, value in values.items():
+            cparser[section][key] = value
+    return Config(cparser)
+
+
+def crawl(config_file, overrides, cache_server, directory, restart):
+    """Run one crawl in this (forked) process, until done or interrupted."""
+    os.chdir(directory)
+    # A process group of its own, so the interrupt reaches every shard.
+    os.setpgrp()
+    logging.disable(logging.INFO)
+
+    from crawler import Crawler
+    from crawler.sharded import ShardedCrawler
+
+    config = _config(config_file, overrides)
+    config.cache_server = cache_server
+    crawler_class = ShardedCrawler if config.processes > 1 else Crawler
+    try:
+        crawler_class(config, restart).start()
+    except KeyboardInterrupt:
+        pass
+
+
+def completed_urls(config_file, overrides, directory):
+    """The urls recorded as complete in the save files of a crawl."""
+    from crawler.store import get_store_class
+
+    config = _config(config_file, overrides)
+    save_file = os.path.join(directory, config.save_file)
+    save_files = [save_file]
+    if config.processes > 1:
+        save_files = [
+            f"{save_file}.shard{shard}" for shard in range(config.processes)]
+    store_class = get_store_class(config)
+    urls = set()
+    for name in save_files:
+        shard_config = copy.copy(config)
+        shard_config.save_file = name
+        store = store_class(shard_config)
+        urls.update(url for url, completed in store.values() if completed)
+        store.close()
+    return urls
+
+
+def run(args, overrides, server, interrupt_after):
+    """
+    Crawl to the end in a fresh directory, interrupting the first runs
+    after each of `interrupt_after` seconds. Returns the completed urls.
+    """
+    config_file = os.path.abspath(args.config_file)
+    directory = tempfile.mkdtemp(prefix="shard_resume_")
+    try:
+        restart = True
+        for seconds in list(interrupt_after) + [None]:
+            process = multiprocessing.Process(
+                target=crawl, args=(
+                    config_file, overrides, server.address, directory,
+                    restart))
+            process.start()
+            process.join(seconds)
+            if process.is_alive():
+                os.killpg(process.pid, signal.SIGINT)
+                process.join()
+            restart = False
+        return completed_urls(config_file, overrides, directory)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main(args):
+    multiprocessing.set_start_method("fork", force=True)
+    web = web_from_args(args)
+    server = FakeCacheServer(web, args.latency).start()
+    overrides = {
+        "LOCAL PROPERTIES": {
+            "SAVE": "frontier.shelve",
+            "PROCESSES": str(args.processes),
+            "THREADCOUNT": str(args.threads),
+            "METRICSINTERVAL": "0",
+            "METRICSPORT": "0"},
+        "CRAWLER": {
+            "POLITENESS": str(args.politeness),
+            "NEARDUPCAPACITY": "0",
+            "SEEDURL": ",".join(web.seeds())},
+    }
+    try:
+        expected = run(args, overrides, server, [])
+        print(f"uninterrupted: {len(expected)} urls completed")
+        found = run(
+            args, overrides, server, [args.interrupt] * args.interrupts)
+        print(f"interrupted {args.interrupts} times: {len(found)} urls "
+              f"completed, {len(expected - found)} missing, "
+              f"{len(found - expected)} extra")
+    finally:
+        server.stop()
+    return 0 if found == expected else 1
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    add_web_arguments(parser)
+    parser.set_defaults(fan_out=2)
+    parser.add_argument("--processes", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=4,
+                        help="THREADCOUNT of each process")
+    parser.add_argument("--politeness", type=float, default=0.05,
+                        help="POLITENESS for the run, in seconds")
+    parser.add_argument("--interrupt", type=float, default=1.0,
+                        help="seconds each interrupted run crawls")
+    parser.add_argument("--interrupts", type=int, default=5)
+    parser.add_argument("--config_file", type=str, default="config.ini")
+    sys.exit(main(parser.parse_args()))
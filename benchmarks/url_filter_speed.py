@@ -0,0 +1,58 @@
+"""
+Throughput of the static url rules behind scraper.is_valid, cold (every url
+new) and warm (verdicts served from the per-url cache).
+
+    python -m benchmarks.url_filter_speed --urls 200000 --target 100000
+
+Exits non-zero if the cold rate is below --target urls/sec.
+"""
+import random
+import time
+from argparse import ArgumentParser
+
+import scraper
+
+HOSTS = [
+    "www.ics.uci.edu", "www.cs.uci.edu", "www.informatics.uci.edu",
+    "www.stat.uci.edu", "wics.ics.uci.edu", "grape.ics.uci.edu",
+    "www.example.com", "today.uci.edu"]
+PATHS = [
+    "/~user{i}/pubs/paper{i}.pdf", "/community/news/view_news?id={i}",
+    "/events/calendar/{i}", "/faculty/profiles/view_faculty.php?ucinetid={i}",
+    "/department/information_computer_sciences/story{i}",
+    "/wiki/doku.php?id=page{i}", "/a/b/c/d/e/f/g/h/{i}", "/page{i}.html"]
+
+
+def synthetic_urls(count, seed=0):
+    rng = random.Random(seed)
+    return [
+        f"https://{rng.choice(HOSTS)}{rng.choice(PATHS).format(i=i)}"
+        for i in range(count)]
+
+
+def rate(urls, check):
+    start = time.perf_counter()
+    accepted = sum(1 for url in urls if check(url))
+    return len(urls) / (time.perf_counter() - start), accepted
+
+
+def main(count, target):
+    urls = synthetic_urls(count)
+    url_filter = scraper.url_filter
+    url_filter.allowed.cache_clear()
+    cold, accepted = rate(urls, url_filter.allowed)
+    warm, _ = rate(urls[-url_filter.allowed.cache_info().maxsize:],
+                   url_filter.allowed)
+    print(f"{count} urls, {accepted} accepted")
+    print(f"cold {cold:12,.0f} urls/sec")
+    print(f"warm {warm:12,.0f} urls/sec")
+    if cold < target:
+        raise SystemExit(f"below target of {target:,} urls/sec")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--urls", type=int, default=200000)
+    parser.add_argument("--target", type=int, default=100000)
+    args = parser.parse_args()
+    main(args.urls, args.target)
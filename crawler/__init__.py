@@ -1,25 +1,68 @@
 from utils import get_logger
+from utils.metrics import metrics, MetricsReporter
+from utils.profiler import profiler
 from crawler.frontier import Frontier
 from crawler.worker import Worker
+from crawler.pipeline import ParseStage
+import scraper
 
 class Crawler(object):
     def __init__(self, config, restart, frontier_factory=Frontier, worker_factory=Worker):
         self.config = config
         self.logger = get_logger("CRAWLER")
+        metrics.sample_every = config.metrics_sample
+        self.reporter = MetricsReporter(config, get_logger("METRICS"))
+        # Compile the url rules before the frontier validates its save file,
+        # and resume the report statistics along with the frontier.
+        scraper.configure(config, restart)
         self.frontier = frontier_factory(config, restart)
+        # Completions are committed with the statistics snapshots.
+        self.frontier.hold_completions = True
+        scraper.stats.take_completions = self.frontier.take_completions
+        scraper.trap_detector = getattr(self.frontier, "traps", None)
+        scraper.robots = getattr(self.frontier, "robots", None)
         self.workers = list()
         self.worker_factory = worker_factory
+        self.parse_stage = (
+            ParseStage(config) if config.parse_processes > 0 else None)
 
     def start_async(self):
+        # Only pass the parse stage when enabled so custom worker factories
+        # keep the (worker_id, config, frontier) signature.
+        kwargs = {"parse_stage": self.parse_stage} if self.parse_stage else {}
         self.workers = [
-            self.worker_factory(worker_id, self.config, self.frontier)
+            self.worker_factory(
+                worker_id, self.config, self.frontier, **kwargs)
             for worker_id in range(self.config.threads_count)]
+        self.reporter.start()
+        profiler.start(self.config)
         for worker in self.workers:
             worker.start()
 
     def start(self):
         self.start_async()
-        self.join()
+        try:
+            self.join()
+        except KeyboardInterrupt:
+            # A page fetched but not completed is counted in the report
+            # statistics, so once resumed it would be skipped as a duplicate
+            # and its links never followed.
+            self.logger.info(
+                "Interrupted, finishing the pages in flight; press Ctrl-C "
+                "again to stop now.")
+            self.frontier.stop()
+            self.join()
+            raise
+        finally:
+            # Also on Ctrl-C, so the save file, trap counters, robots rules
+            # and resume files are written.
+            if self.parse_stage:
+                self.parse_stage.close()
+            # Commits the completions of the pages it counts.
+            scraper.stats.snapshot()
+            self.frontier.close()
+            self.reporter.stop()
+            profiler.stop(get_logger("PROFILE"))
 
     def join(self):
         for worker in self.workers:
@@ -0,0 +1,107 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread
+
+from crawler.worker import check_scraper, record_download
+from utils import get_logger
+from utils.async_download import AsyncDownloader
+from utils.profiler import profiler
+import scraper
+
+
+# Stages of the helper threads; downloads share the event loop thread, so
+# only the sampling profiler sees them.
+def _next_url(frontier):
+    with profiler.stage("frontier"):
+        return frontier.get_tbd_url(1)
+
+
+def _scrape(url, resp):
+    with profiler.stage("scrape"):
+        return scraper.scraper(url, resp)
+
+
+class AsyncWorker(Thread):
+    """
+    Worker that runs one event loop with up to `config.max_inflight`
+    concurrent downloads over pooled connections to the cache server.
+    Selected with FETCHMODE = async; it has the same constructor as Worker so
+    it plugs into Crawler through worker_factory.
+    """
+    def __init__(self, worker_id, config, frontier, parse_stage=None):
+        self.logger = get_logger(f"Worker-{worker_id}", "Worker")
+        self.config = config
+        self.frontier = frontier
+        self.worker_id = worker_id
+        self.parse_stage = parse_stage
+        check_scraper()
+        super().__init__(daemon=True)
+
+    def run(self):
+        asyncio.run(self._crawl())
+
+    async def _crawl(self):
+        loop = asyncio.get_running_loop()
+        downloader = AsyncDownloader(self.config, self.logger)
+        # Frontier.get_tbd_url blocks, so it runs on a single helper thread.
+        dispatch_pool = ThreadPoolExecutor(max_workers=1)
+        # A url is only taken from the frontier once a download can start.
+        # Urls held back while every download is busy would go out back to
+        # back, however far apart the frontier released them.
+        slots = asyncio.Semaphore(self.config.max_inflight)
+        fetches = set()
+        try:
+            while True:
+                await slots.acquire()
+                tbd_url = await loop.run_in_executor(
+                    dispatch_pool, _next_url, self.frontier)
+                if tbd_url:
+                    fetch = asyncio.create_task(
+                        self._fetch(tbd_url, downloader, slots))
+                    fetches.add(fetch)
+                    fetch.add_done_callback(fetches.discard)
+                    continue
+                slots.release()
+                if await loop.run_in_executor(
+                        dispatch_pool, self.frontier.is_drained):
+                    self.logger.info("Frontier is empty. Stopping Crawler.")
+                    break
+            await asyncio.gather(*fetches)
+        finally:
+            dispatch_pool.shutdown()
+            downloader.close()
+
+    async def _fetch(self, tbd_url, downloader, slots):
+        loop = asyncio.get_running_loop()
+        handed_off = False
+        try:
+            start = time.perf_counter()
+            resp = await downloader.download(tbd_url)
+            record_download(tbd_url, resp, time.perf_counter() - start)
+            self.logger.info(
+                f"Downloaded {tbd_url}, status <{resp.status}>, "
+                f"using cache {self.config.cache_server}.",
+                extra={"url": tbd_url})
+            # Parsing is CPU bound and the frontier takes its lock and may
+            # fsync; keep both off the event loop. submit blocks while the
+            # parse stage is full.
+            if self.parse_stage:
+                await loop.run_in_executor(
+                    None, self.parse_stage.submit,
+                    tbd_url, resp, self.frontier)
+                handed_off = True
+            else:
+                scraped_urls = await loop.run_in_executor(
+                    None, _scrape, tbd_url, resp)
+                await loop.run_in_executor(
+                    None, self.frontier.add_urls, scraped_urls, tbd_url)
+        except Exception as e:
+            self.logger.error(f"Failed to process {tbd_url}: {e}")
+        finally:
+            try:
+                if not handed_off:
+                    await loop.run_in_executor(
+                        None, self.frontier.mark_url_complete, tbd_url)
+            finally:
+                slots.release()
@@ -1,58 +1,181 @@
-import os
-import shelve
 import time
-from threading import Thread, RLock, Lock
-from queue import Queue, Empty
-from urllib.parse import urlparse
 from collections import defaultdict
+from itertools import islice
+from threading import RLock, Condition, Thread
+from urllib.parse import urlparse
 
-from utils import get_logger, get_urlhash, normalize
-from scraper import is_valid
+from crawler.priority import get_policy
+from crawler.resume import ResumeFiles
+from crawler.robots import RobotsCache
+from crawler.scheduler import HostScheduler
+from crawler.store import get_store_class
+from crawler.traps import TrapDetector
+from utils import get_logger, normalize
+from utils.metrics import metrics
+from utils.fingerprint import FingerprintSet, url_fingerprint
+
+# Urls the loader queues per acquisition of the frontier lock.
+LOAD_CHUNK = 1024
 
 class Frontier(object):
     def __init__(self, config, restart):
         self.logger = get_logger("FRONTIER")
         self.config = config
-        self.to_be_downloaded = list()
+        # Per-domain priority queues; a domain is served once its politeness
+        # delay has passed, the domain with the best url first.
+        self.to_be_downloaded = HostScheduler(self.config.time_delay)
+        # Scores urls from their depth, path pattern and domain.
+        self.policy = get_policy(self.config)
+        # Urls admitted per domain, for the policy.
+        self.host_counts = defaultdict(int)
         
         # Thread safety locks
         self.lock = RLock()  # Main lock for frontier operations
-        self.domain_locks = defaultdict(Lock)  # Per-domain locks
-        self.domain_last_access = {}  # Track last access time per domain
+        # Signalled when new work is queued, a url completes, or the
+        # frontier drains. Waiters also time out when a domain's politeness
+        # window opens.
+        self.ready = Condition(self.lock)
+        # The lock, observing how long a sample of acquisitions waited.
+        self.timed_lock = metrics.timed_lock(self.lock, "frontier_lock_wait")
+        # Urls handed to workers but not yet marked complete, with their
+        # depth (links followed from a seed).
+        self.in_flight = dict()
+        metrics.gauge("frontier_size", self._size)
+        metrics.gauge("hosts_in_cooldown", self._hosts_in_cooldown)
+        metrics.gauge("in_flight", lambda: len(self.in_flight))
         
-        if not os.path.exists(self.config.save_file) and not restart:
+        store_class = get_store_class(self.config)
+        save_exists = store_class.exists(self.config.save_file)
+        if not save_exists and not restart:
             # Save file does not exist, but request to load save.
             self.logger.info(
                 f"Did not find save file {self.config.save_file}, "
                 f"starting from seed.")
-        elif os.path.exists(self.config.save_file) and restart:
+        elif save_exists and restart:
             # Save file does exists, but request to start from seed.
             self.logger.info(
                 f"Found save file {self.config.save_file}, deleting it.")
-            os.remove(self.config.save_file)
+            store_class.remove(self.config.save_file)
+        # The pending urls and seen set written at the last clean shutdown.
+        self.resume = ResumeFiles(self.config.save_file, store_class)
+        if restart:
+            self.resume.remove()
+        # Checked before the store is opened, which may compact it.
+        resumable = not restart and self.resume.valid()
         # Load existing save file, or create one if it does not exist.
-        self.save = shelve.open(self.config.save_file)
+        self.save = store_class(self.config)
+        # Per path-pattern admission counters, saved next to the save file.
+        self.traps = TrapDetector(self.config, restart)
+        # robots.txt rules, Crawl-delays and sitemaps per domain.
+        self.robots = RobotsCache(self.config, restart, self)
+        for domain, delay in self.robots.crawl_delays():
+            self.to_be_downloaded.set_delay(domain, delay)
+        # Fingerprints of every url ever added, so duplicate links are
+        # dropped without a lookup in the save file.
+        self.seen = FingerprintSet()
+        # Until the save file is loaded the seen set is incomplete, so
+        # links found meanwhile wait in `deferred` as (urls, depth). The
+        # frontier only counts as `loaded`, and can drain, once they and the
+        # seeds are queued.
+        self.seen_loaded = restart
+        self.loaded = restart
+        self.deferred = list()
+        # (fingerprint, url, depth) of the urls completed since the last
+        # report statistics snapshot, while `hold_completions`.
+        self.hold_completions = False
+        self.completions = list()
+        # Set by stop(): no url is handed out, but those in flight complete.
+        self.stopped = False
+        self.closed = False
         if restart:
             for url in self.config.seed_urls:
                 self.add_url(url)
         else:
-            # Set the frontier state with contents of save file.
-            self._parse_save_file()
-            if not self.save:
-                for url in self.config.seed_urls:
-                    self.add_url(url)
+            # Load the save file in the background; workers fetch the
+            # pending urls as they are queued.
+            self.loader = Thread(
+                target=self._load, args=(resumable,), name="FrontierLoader",
+                daemon=True)
+            self.loader.start()
+
+    def _load(self, resumable):
+        start = time.time()
+        if resumable:
+            seen = self.resume.seen()
+            with self.lock:
+                self.seen = seen
+            tbd_count = self._load_chunks(
+                self.resume.pending(), self._enqueue_pending)
+        else:
+            tbd_count = self._parse_save_file()
+        with self.lock:
+            if self.closed:
+                return
+            self.seen_loaded = True
+            deferred, self.deferred = self.deferred, list()
+        # Without the lock: a subclass's add_urls may take locks of its own.
+        for urls, depth in deferred:
+            if self.closed:
+                return
+            self.add_urls(urls, depth=depth)
+        if not self.seen:
+            for url in self.config.seed_urls:
+                self.add_url(url)
+        with self.lock:
+            if self.closed:
+                return
+            self.loaded = True
+            for url in self.robots.resumed:
+                self._push_fetch(url)
+            if resumable:
+                # A crash from here on leaves the save file to be scanned.
+                self.resume.remove()
+            self.logger.info(
+                f"Found {tbd_count} urls to be downloaded from "
+                f"{len(self.seen)} total urls discovered, in "
+                f"{time.time() - start:.2f} seconds"
+                f"{' from the resume files' if resumable else ''}.")
+            self.ready.notify_all()
+
+    def _load_chunks(self, records, load):
+        """
+        Call `load` on every record, LOAD_CHUNK at a time with the lock
+        held, waking workers after each chunk. Returns the records loaded.
+        """
+        records = iter(records)
+        count = 0
+        while True:
+            with self.lock:
+                if self.closed:
+                    return count
+                chunk = list(islice(records, LOAD_CHUNK))
+                for record in chunk:
+                    count += load(record)
+                self.ready.notify_all()
+            if len(chunk) < LOAD_CHUNK:
+                return count
+
+    def _enqueue_pending(self, record):
+        score, depth, url = record
+        self._enqueue(url, depth, 1, score)
+        return 1
+
+    def _load_record(self, record):
+        fingerprint, url, completed = record
+        self.seen.add(fingerprint)
+        if completed:
+            return 0
+        # Urls were checked with is_valid when they were added.
+        self._enqueue(url, 0, 1)
+        return 1
 
     def _parse_save_file(self):
-        """This function can be overridden for alternate saving techniques."""
-        total_count = len(self.save)
-        tbd_count = 0
-        for url, completed in self.save.values():
-            if not completed and is_valid(url):
-                self.to_be_downloaded.append(url)
-                tbd_count += 1
-        self.logger.info(
-            f"Found {tbd_count} urls to be downloaded from {total_count} "
-            f"total urls discovered.")
+        """
+        Stream every record of the save file into the seen set and queue the
+        incomplete ones. Returns the number queued. This function can be
+        overridden for alternate saving techniques.
+        """
+        return self._load_chunks(self.save.records(), self._load_record)
 
     def _get_domain(self, url):
         """Extract domain from URL."""
@@ -62,64 +185,243 @@ class Frontier(object):
         except:
             return None
 
-    def get_tbd_url(self):
+    def _size(self):
+        with self.lock:
+            return len(self.to_be_downloaded)
+
+    def _hosts_in_cooldown(self):
+        with self.lock:
+            return self.to_be_downloaded.cooling(time.time())
+
+    def set_crawl_delay(self, domain, delay):
         """
-        Get a URL that's ready to be downloaded, respecting politeness delay.
-        Returns None if no URLs are available or all domains are in cooldown.
+        Wait `delay` seconds between fetches from `domain`, such as the
+        Crawl-delay of its robots.txt, when that is longer than POLITENESS.
+        None reverts to POLITENESS.
         """
         with self.lock:
-            if not self.to_be_downloaded:
-                return None
-            
-            current_time = time.time()
-            politeness_delay = self.config.time_delay
-            
-            # Try to find a URL whose domain is ready
-            for i in range(len(self.to_be_downloaded)):
-                url = self.to_be_downloaded[i]
-                domain = self._get_domain(url)
-                
-                if domain is None:
-                    continue
-                
-                # Check if enough time has passed since last access to this domain
-                last_access = self.domain_last_access.get(domain, 0)
-                time_since_last = current_time - last_access
-                
-                if time_since_last >= politeness_delay:
-                    # This URL is ready to be downloaded
-                    self.to_be_downloaded.pop(i)
-                    self.domain_last_access[domain] = current_time
+            self.to_be_downloaded.set_delay(domain, delay)
+
+    def queue_fetch(self, url):
+        """Queue a robots.txt or sitemap url of the RobotsCache."""
+        with self.lock:
+            self._push_fetch(url)
+            self.ready.notify()
+
+    def _push_fetch(self, url):
+        # Ahead of every page of its domain; not recorded in the save file.
+        domain = self._get_domain(url)
+        if domain is not None:
+            self.to_be_downloaded.push(domain, (url, 0), float("-inf"))
+
+    def _disallow(self, url):
+        # Recorded as complete so it is neither queued again nor resumed.
+        self.save.put(url_fingerprint(url), url, True)
+        metrics.count("robots_disallowed")
+
+    def _enqueue(self, url, depth, pattern_count, score=None):
+        domain = self._get_domain(url)
+        if domain is None:
+            self.logger.error(f"Could not parse domain of {url}, skipping.")
+            return
+        robots_url = self.robots.robots_url(url)
+        if robots_url:
+            self._push_fetch(robots_url)
+        if not self.robots.allowed(url):
+            self._disallow(url)
+            return
+        if score is None:
+            score = self.policy.score(
+                depth, pattern_count, self.host_counts[domain])
+        self.host_counts[domain] += 1
+        self.to_be_downloaded.push(domain, (url, depth), score)
+
+    def get_tbd_url(self, timeout=None):
+        """
+        Get a URL that's ready to be downloaded, respecting politeness delay.
+        Blocks until a domain leaves cooldown or new urls are added. Returns
+        None once the frontier is drained (nothing queued and nothing in
+        flight), or when `timeout` seconds pass without a ready URL.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self.timed_lock:
+            while True:
+                if self.closed or self.stopped:
+                    return None
+                now = time.time()
+                item, wait = self.to_be_downloaded.pop(now)
+                if item:
+                    url, depth = item
+                    if not self.robots.allowed(url):
+                        # The rules arrived after the url was queued.
+                        self._disallow(url)
+                        continue
+                    if self.robots.is_robots(url):
+                        # No page of the host until its rules are in.
+                        self.to_be_downloaded.block(self._get_domain(url))
+                    self.in_flight[url] = depth
                     return url
-            
-            # No URLs available that respect politeness
-            return None
+                if wait is None and self.is_drained():
+                    return None
+                if deadline is not None:
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        return None
+                    wait = remaining if wait is None else min(wait, remaining)
+                self.ready.wait(wait)
 
     def add_url(self, url):
         """Add a URL to the frontier in a thread-safe manner."""
-        url = normalize(url)
-        urlhash = get_urlhash(url)
+        self.add_urls((url,))
+
+    def add_urls(self, urls, parent=None, depth=None):
+        """
+        Add many URLs to the frontier with a single lock acquisition and a
+        single store write. Returns the number of URLs that were new.
+        The URLs are one link deeper than `parent`, the in flight URL they
+        were found on, unless `depth` is given; seeds are depth 0.
+        """
+        # Normalize and fingerprint before taking the lock.
+        candidates = dict()
+        for url in urls:
+            url = normalize(url)
+            candidates.setdefault(url_fingerprint(url), url)
+        if not candidates:
+            return 0
         
-        with self.lock:
-            if urlhash not in self.save:
-                self.save[urlhash] = (url, False)
-                self.save.sync()
-                self.to_be_downloaded.append(url)
+        with self.timed_lock:
+            if self.closed:
+                return 0
+            if depth is None:
+                depth = (self.in_flight.get(parent, 0) + 1
+                         if parent is not None else 0)
+            if not self.seen_loaded:
+                self.deferred.append((list(candidates.values()), depth))
+                return 0
+            added = list()
+            for fingerprint, url in candidates.items():
+                if fingerprint in self.seen:
+                    continue
+                # Urls over their pattern's limit are not marked seen, so
+                # every rediscovery counts as another hit on the trap.
+                pattern_count = self.traps.admit(url)
+                if not pattern_count:
+                    continue
+                self.seen.add(fingerprint)
+                added.append((fingerprint, url, pattern_count))
+            if added:
+                self.save.put_many(
+                    (fingerprint, url, False) for fingerprint, url, _ in added)
+                for _, url, pattern_count in added:
+                    self._enqueue(url, depth, pattern_count)
+                self.ready.notify(len(added))
+        self.traps.save_every(self.config.trap_save_interval)
+        return len(added)
     
     def mark_url_complete(self, url):
         """Mark a URL as complete in a thread-safe manner."""
-        urlhash = get_urlhash(url)
+        fingerprint = url_fingerprint(url)
         
-        with self.lock:
-            if urlhash not in self.save:
+        with self.timed_lock:
+            if self.closed:
+                # Still in flight when the frontier closed, so saved as
+                # pending.
+                return
+            if self.robots.finish(url):
+                # Taken in or failed; either way the host may go on, and
+                # waiting workers may be able to stop.
+                self.in_flight.pop(url, None)
+                self.to_be_downloaded.unblock(self._get_domain(url))
+                self.ready.notify_all()
+                return
+            if self.loaded and fingerprint not in self.seen:
                 # This should not happen.
                 self.logger.error(
                     f"Completed url {url}, but have not seen it before.")
             
-            self.save[urlhash] = (url, True)
-            self.save.sync()
+            depth = self.in_flight.pop(url, 0)
+            if self.hold_completions:
+                self.completions.append((fingerprint, url, depth))
+            else:
+                self.save.put(fingerprint, url, True)
+            if self.is_drained():
+                # Wake every waiting worker so they can stop.
+                self.ready.notify_all()
     
     def has_pending_urls(self):
         """Check if there are any pending URLs."""
         with self.lock:
-            return len(self.to_be_downloaded) > 0
\ No newline at end of file
+            return len(self.to_be_downloaded) > 0
+
+    def is_drained(self):
+        """
+        True when the save file is loaded, nothing is queued and no url is
+        still being processed, or once the frontier is stopped or closed.
+        """
+        with self.lock:
+            return self.closed or self.stopped or (
+                self.loaded and not self.to_be_downloaded
+                and not self.in_flight)
+
+    def _pending(self):
+        """(score, depth, url) of every url not downloaded yet, best first."""
+        # Urls still in flight were about to be downloaded, and completed
+        # urls not committed yet must be downloaded again, so both go first.
+        # robots.txt urls are queued again as needed, and sitemaps are
+        # saved by the RobotsCache.
+        for _, url, depth in self.completions:
+            yield float("-inf"), depth, url
+        for url, depth in self.in_flight.items():
+            if not self.robots.handles(url):
+                yield float("-inf"), depth, url
+        for score, _, (url, depth) in sorted(self.to_be_downloaded.items()):
+            if not self.robots.handles(url):
+                yield score, depth, url
+
+    def take_completions(self):
+        """
+        Take the urls completed since the last call, and return a function
+        committing them to the save file. With `hold_completions` set, urls
+        are only committed this way: the report statistics take them before
+        each snapshot and commit them after it, so a crash never leaves a
+        url complete whose page the resumed statistics do not count.
+        """
+        with self.lock:
+            completions, self.completions = self.completions, list()
+
+        def commit():
+            with self.lock:
+                if self.closed:
+                    # close() saved them as pending.
+                    return
+                self.save.put_many(
+                    (fingerprint, url, True)
+                    for fingerprint, url, _ in completions)
+        return commit
+
+    def stop(self):
+        """
+        Hand out no more urls. The urls in flight can still add their links
+        and be marked complete, so workers finish their pages before close().
+        """
+        with self.lock:
+            self.stopped = True
+            self.ready.notify_all()
+
+    def close(self):
+        """
+        Commit any buffered records and close the save file. Once the save
+        file was fully loaded the pending urls, including those still in
+        flight, are written for a fast resume. Workers still running get no
+        more urls and their results are dropped.
+        """
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.ready.notify_all()
+            self.save.close()
+            self.traps.save()
+            self.robots.save()
+            if self.loaded:
+                self.resume.write(self.seen, self._pending())
\ No newline at end of file
@@ -0,0 +1,69 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+from threading import BoundedSemaphore
+
+from utils import get_logger
+from utils.metrics import metrics
+import scraper
+
+
+def _timed_parse(url, content):
+    """scraper.parse_page, with the time it took in the parsing process."""
+    start = time.perf_counter()
+    result = scraper.parse_page(url, content)
+    return time.perf_counter() - start, result
+
+
+class ParseStage(object):
+    """
+    Parses downloaded pages in a pool of PARSEPROCESSES processes so that
+    the html_scan pass collecting links and words, and the SimHash over the
+    words, run outside the fetching threads and the GIL.
+
+    Fetch workers hand over the page with submit(). At most PARSEQUEUE pages
+    are queued or being parsed; beyond that submit() blocks, which slows the
+    fetchers down to the speed of the parsers. Links and word statistics come
+    back to this process, where the report globals are updated, the links are
+    filtered and added to the frontier, and the url is marked complete.
+    """
+    def __init__(self, config):
+        self.logger = get_logger("PARSER")
+        self.config = config
+        self.slots = BoundedSemaphore(config.parse_queue)
+        self.pool = ProcessPoolExecutor(max_workers=config.parse_processes)
+
+    def submit(self, url, resp, frontier):
+        """
+        Queue a downloaded page for parsing. The stage marks the url complete
+        once its links are in the frontier, including when the page is
+        rejected here.
+        """
+        content = scraper.admit_page(url, resp)
+        if content is None:
+            frontier.mark_url_complete(url)
+            return
+        self.slots.acquire()
+        try:
+            future = self.pool.submit(_timed_parse, url, content)
+        except Exception:
+            self.slots.release()
+            frontier.mark_url_complete(url)
+            raise
+        future.add_done_callback(
+            lambda future: self._finish(url, future, frontier))
+
+    def _finish(self, url, future, frontier):
+        self.slots.release()
+        try:
+            seconds, result = future.result()
+            metrics.observe("parse", seconds)
+            links, word_counts, word_total, fingerprint = result
+            if scraper.record_page(url, word_counts, word_total, fingerprint):
+                frontier.add_urls(scraper.filter_links(links), parent=url)
+        except Exception as e:
+            self.logger.error(f"Failed to parse {url}: {e}")
+        finally:
+            frontier.mark_url_complete(url)
+
+    def close(self):
+        self.pool.shutdown(wait=True)
@@ -0,0 +1,47 @@
+from math import log2
+
+
+class FifoPolicy(object):
+    """Every url scores the same, so each host is served in discovery order."""
+    def score(self, depth, pattern_count, host_count):
+        return 0
+
+
+class PriorityPolicy(object):
+    """
+    Scores urls so the crawl covers many distinct pages early; lower scores
+    are fetched first.
+
+    - depth_weight per link followed from a seed (breadth first),
+    - pattern_weight per doubling of the urls admitted under the same path
+      pattern, so trap-like areas sink well before TRAPLIMIT cuts them off,
+    - host_weight per doubling of the urls admitted from the host, so large
+      hosts do not crowd out small ones,
+    - minus new_host_boost for the first url of a host never seen before.
+    """
+    def __init__(self, depth_weight=1.0, pattern_weight=0.5, host_weight=0.25,
+                 new_host_boost=2.0):
+        self.depth_weight = depth_weight
+        self.pattern_weight = pattern_weight
+        self.host_weight = host_weight
+        self.new_host_boost = new_host_boost
+
+    def score(self, depth, pattern_count, host_count):
+        """
+        `pattern_count` and `host_count` are the urls admitted under the
+        url's path pattern (including this one) and from its host (before
+        this one).
+        """
+        score = (self.depth_weight * depth
+                 + self.pattern_weight * log2(max(pattern_count, 1))
+                 + self.host_weight * log2(1 + host_count))
+        if not host_count:
+            score -= self.new_host_boost
+        return score
+
+
+POLICIES = {"priority": PriorityPolicy, "fifo": FifoPolicy}
+
+
+def get_policy(config):
+    return POLICIES[config.priority]()
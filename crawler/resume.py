@@ -0,0 +1,81 @@
+import json
+import os
+
+from crawler.store import _escape
+from utils.fingerprint import FingerprintSet
+
+
+class ResumeFiles(object):
+    """
+    The frontier as it was at a clean shutdown, so the next start does not
+    scan the whole save file. "<SAVE>.seen" holds the dumped fingerprint set
+    and "<SAVE>.pending" a header line followed by one
+    "<score>\t<depth>\t<url>" line per url still to be downloaded, best
+    first.
+
+    The header records the size and modification time of the save file's
+    files after it was closed. If they no longer match (the crawl crashed
+    after resuming, or the save file was changed since) the files are
+    ignored and the frontier falls back to scanning the save file.
+    """
+    def __init__(self, save_file, store_class):
+        self.save_file = save_file
+        self.store_class = store_class
+        self.seen_file = f"{save_file}.seen"
+        self.pending_file = f"{save_file}.pending"
+
+    def _stamp(self):
+        stamp = list()
+        for name in self.store_class.files(self.save_file):
+            stat = os.stat(name)
+            stamp.append([name, stat.st_size, stat.st_mtime_ns])
+        return stamp
+
+    def valid(self):
+        """True if the files describe the save file as it is now."""
+        if not (os.path.exists(self.seen_file)
+                and os.path.exists(self.pending_file)):
+            return False
+        with open(self.pending_file, "r", encoding="utf-8") as f:
+            try:
+                header = json.loads(f.readline())
+            except ValueError:
+                return False
+        return header.get("stamp") == self._stamp()
+
+    def seen(self):
+        with open(self.seen_file, "rb") as f:
+            return FingerprintSet.load(f)
+
+    def pending(self):
+        """Stream (score, depth, url) for every pending url."""
+        with open(self.pending_file, "r", encoding="utf-8",
+                  newline="\n") as f:
+            f.readline()
+            for line in f:
+                if not line.endswith("\n"):
+                    break
+                score, depth, url = line[:-1].split("\t", 2)
+                yield float(score), int(depth), url
+
+    def write(self, seen, pending):
+        """
+        Write the fingerprint set and the (score, depth, url) of the pending
+        urls. Call after the save file is closed, as its state is stamped.
+        """
+        with open(f"{self.seen_file}.tmp", "wb") as f:
+            seen.dump(f)
+        with open(f"{self.pending_file}.tmp", "w", encoding="utf-8",
+                  newline="\n") as f:
+            f.write(json.dumps({"stamp": self._stamp()}) + "\n")
+            f.writelines(
+                f"{score!r}\t{depth}\t{_escape(url)}\n"
+                for score, depth, url in pending)
+        # The pending file is replaced last; its stamp validates both.
+        os.replace(f"{self.seen_file}.tmp", self.seen_file)
+        os.replace(f"{self.pending_file}.tmp", self.pending_file)
+
+    def remove(self):
+        for name in (self.seen_file, self.pending_file):
+            if os.path.exists(name):
+                os.remove(name)
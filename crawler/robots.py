@@ -0,0 +1,299 @@
+import gzip
+import html
+import io
+import json
+import os
+import re
+import time
+from collections import defaultdict
+from threading import Lock
+from urllib.parse import urlparse
+
+from utils.metrics import metrics
+import scraper
+
+# Crawl-delays longer than this, in seconds, are cut down to it.
+MAX_CRAWL_DELAY = 60
+# Sitemaps followed per host, counting nested sitemap indexes.
+MAX_SITEMAPS = 50
+# Bytes read from a gzipped sitemap once decompressed.
+MAX_SITEMAP_BYTES = 50 * 2 ** 20
+LOC = re.compile(rb"<loc>\s*(.*?)\s*</loc>", re.DOTALL | re.IGNORECASE)
+SITEMAP_INDEX = re.compile(rb"<sitemapindex\b", re.IGNORECASE)
+
+
+def _pattern(path):
+    """Regex of a robots.txt path: * matches anything, a final $ the end."""
+    anchored = path.endswith("$")
+    if anchored:
+        path = path[:-1]
+    source = ".*".join(re.escape(part) for part in path.split("*"))
+    return source + "$" if anchored else source
+
+
+class RobotsRules(object):
+    """
+    The Allow and Disallow rules of one robots.txt that apply to us,
+    compiled into one regex with a group per rule, longest rule first. The
+    first group that matches a path is the most specific rule, which
+    decides; Allow wins a tie, and a path no rule matches is allowed.
+    """
+    def __init__(self, rules=(), crawl_delay=None, sitemaps=()):
+        # (allow, path) pairs.
+        self.rules = sorted(
+            rules, key=lambda rule: (-len(rule[1]), not rule[0]))
+        self.crawl_delay = crawl_delay
+        self.sitemaps = list(sitemaps)
+        self.matcher = None
+        if self.rules:
+            self.matcher = re.compile("|".join(
+                f"({_pattern(path)})" for _, path in self.rules))
+
+    @classmethod
+    def parse(cls, text, user_agent):
+        """
+        Rules of the groups naming a word of `user_agent`, or else of the
+        "*" groups. Sitemap lines apply whatever their group.
+        """
+        words = set(user_agent.lower().replace(",", " ").split())
+        groups = list()
+        agents, lines, in_rules = list(), list(), False
+        sitemaps = list()
+        for line in text.splitlines():
+            line = line.split("#", 1)[0]
+            if ":" not in line:
+                continue
+            field, value = line.split(":", 1)
+            field, value = field.strip().lower(), value.strip()
+            if field == "sitemap":
+                sitemaps.append(value)
+            elif field == "user-agent":
+                if in_rules:
+                    groups.append((agents, lines))
+                    agents, lines, in_rules = list(), list(), False
+                agents.append(value.lower())
+            elif field in ("allow", "disallow", "crawl-delay"):
+                in_rules = True
+                lines.append((field, value))
+        if agents:
+            groups.append((agents, lines))
+
+        chosen = [
+            lines for agents, lines in groups
+            if any(agent != "*" and agent in words for agent in agents)]
+        if not chosen:
+            chosen = [lines for agents, lines in groups if "*" in agents]
+        rules = list()
+        crawl_delay = None
+        for field, value in (line for lines in chosen for line in lines):
+            if field == "crawl-delay":
+                try:
+                    crawl_delay = min(float(value), MAX_CRAWL_DELAY)
+                except ValueError:
+                    pass
+            elif value:
+                # An empty Disallow allows everything.
+                rules.append((field == "allow", value))
+        return cls(rules, crawl_delay, sitemaps)
+
+    def allowed(self, path):
+        if self.matcher is None:
+            return True
+        match = self.matcher.match(path)
+        if match is None:
+            return True
+        return self.rules[match.lastindex - 1][0]
+
+    def state(self):
+        return {
+            "rules": self.rules, "crawl_delay": self.crawl_delay,
+            "sitemaps": self.sitemaps}
+
+    @classmethod
+    def from_state(cls, state):
+        return cls(
+            [tuple(rule) for rule in state["rules"]], state["crawl_delay"],
+            state["sitemaps"])
+
+
+class RobotsCache(object):
+    """
+    robots.txt rules and sitemaps per host, for a Frontier.
+
+    The frontier queues a host's robots.txt ahead of its first url, and
+    again once the rules are older than ROBOTSTTL seconds. Workers download
+    it through the cache server like any page; scraper.admit_page hands it
+    here instead of parsing it. The rules then filter the host's urls as
+    they are queued and again as they are handed out, its Crawl-delay
+    replaces POLITENESS when longer, and its sitemaps are queued the same
+    way. Urls listed in a sitemap go through is_valid into the frontier;
+    sitemap indexes queue the sitemaps they list. Only sitemaps on the
+    robots.txt host are followed, so a host stays with one crawl process.
+
+    Rules and sitemaps still queued are saved as JSON in "<SAVE>.robots".
+    """
+    def __init__(self, config, restart, frontier):
+        self.enabled = config.robots
+        self.ttl = config.robots_ttl
+        self.user_agent = config.user_agent
+        self.frontier = frontier
+        self.save_file = f"{config.save_file}.robots"
+        self.lock = Lock()
+        self.save_lock = Lock()
+        self.hosts = dict()  # host -> (time fetched, RobotsRules)
+        self.fetching = dict()  # queued url -> "robots" or "sitemap"
+        self.sitemaps = defaultdict(set)  # host -> sitemaps queued
+        # Sitemaps that were still queued when the crawl stopped.
+        self.resumed = list()
+        if restart and os.path.exists(self.save_file):
+            os.remove(self.save_file)
+        if os.path.exists(self.save_file):
+            self._load()
+
+    def _load(self):
+        with open(self.save_file, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        for host, (fetched, rules) in state["hosts"].items():
+            self.hosts[host] = (fetched, RobotsRules.from_state(rules))
+        for url in state["sitemaps"]:
+            self.sitemaps[urlparse(url).netloc].add(url)
+            self.fetching[url] = "sitemap"
+            self.resumed.append(url)
+
+    def save(self):
+        with self.lock:
+            state = {
+                "hosts": {
+                    host: (fetched, rules.state())
+                    for host, (fetched, rules) in self.hosts.items()},
+                "sitemaps": [
+                    url for url, kind in self.fetching.items()
+                    if kind == "sitemap"]}
+        with self.save_lock:
+            tmp_file = f"{self.save_file}.tmp"
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+            os.replace(tmp_file, self.save_file)
+
+    def crawl_delays(self):
+        """(host, Crawl-delay) of every host that has one."""
+        with self.lock:
+            return [
+                (host, rules.crawl_delay)
+                for host, (_, rules) in self.hosts.items()
+                if rules.crawl_delay is not None]
+
+    def robots_url(self, url):
+        """
+        The robots.txt url to queue ahead of `url`, or None if the rules of
+        its host are fresh or already queued.
+        """
+        if not self.enabled:
+            return None
+        parsed = urlparse(url)
+        with self.lock:
+            entry = self.hosts.get(parsed.netloc)
+            if entry is not None and time.time() - entry[0] < self.ttl:
+                return None
+            robots_url = f"{parsed.scheme}://{parsed.netloc}/robots.txt"
+            if robots_url in self.fetching:
+                return None
+            self.fetching[robots_url] = "robots"
+            return robots_url
+
+    def is_robots(self, url):
+        """True for a robots.txt url this cache queued."""
+        with self.lock:
+            return self.fetching.get(url) == "robots"
+
+    def handles(self, url):
+        """True for a robots.txt or sitemap url this cache queued."""
+        with self.lock:
+            return url in self.fetching
+
+    def allowed(self, url):
+        parsed = urlparse(url)
+        with self.lock:
+            if url in self.fetching:
+                return True
+            entry = self.hosts.get(parsed.netloc)
+        if entry is None:
+            return True
+        path = parsed.path or "/"
+        if parsed.query:
+            path = f"{path}?{parsed.query}"
+        return entry[1].allowed(path)
+
+    def ingest(self, url, resp):
+        """Take in a downloaded robots.txt or sitemap."""
+        with self.lock:
+            kind = self.fetching.get(url)
+        content = None
+        if resp.status == 200:
+            content = getattr(resp.raw_response, "content", None)
+        if kind == "robots":
+            self._ingest_robots(url, content)
+        elif kind == "sitemap" and content:
+            self._ingest_sitemap(url, content)
+
+    def _ingest_robots(self, url, content):
+        # A missing or unreadable robots.txt allows everything.
+        text = content.decode("utf-8", "replace") if content else ""
+        rules = RobotsRules.parse(text, self.user_agent)
+        host = urlparse(url).netloc
+        with self.lock:
+            self.hosts[host] = (time.time(), rules)
+        metrics.count("robots_fetched")
+        self.frontier.set_crawl_delay(host, rules.crawl_delay)
+        for sitemap in rules.sitemaps:
+            self._queue_sitemap(host, sitemap)
+        self.save()
+
+    def _ingest_sitemap(self, url, content):
+        if content.startswith(b"\x1f\x8b"):
+            try:
+                with gzip.GzipFile(fileobj=io.BytesIO(content)) as f:
+                    content = f.read(MAX_SITEMAP_BYTES)
+            except (OSError, EOFError):
+                return
+        locations = [
+            html.unescape(location.decode("utf-8", "replace"))
+            for location in LOC.findall(content)]
+        if SITEMAP_INDEX.search(content, 0, 4096):
+            host = urlparse(url).netloc
+            for location in locations:
+                self._queue_sitemap(host, location)
+            return
+        added = self.frontier.add_urls(
+            scraper.filter_links(locations), depth=1)
+        metrics.count("sitemap_urls", added)
+
+    def _queue_sitemap(self, host, url):
+        if urlparse(url).netloc != host:
+            return
+        with self.lock:
+            queued = self.sitemaps[host]
+            if url in queued or len(queued) >= MAX_SITEMAPS:
+                return
+            queued.add(url)
+            self.fetching[url] = "sitemap"
+        self.frontier.queue_fetch(url)
+
+    def finish(self, url):
+        """
+        Forget a robots.txt or sitemap url once processed; returns False
+        for any other url. When a robots.txt failed to download, the host
+        keeps its previous rules, or none, until they expire again.
+        """
+        with self.lock:
+            kind = self.fetching.pop(url, None)
+            if kind is None:
+                return False
+            host = urlparse(url).netloc
+            entry = self.hosts.get(host)
+            if kind == "robots" and (
+                    entry is None or time.time() - entry[0] >= self.ttl):
+                # Not taken in: keep the old rules for another TTL.
+                self.hosts[host] = (
+                    time.time(), entry[1] if entry else RobotsRules())
+            return True
@@ -0,0 +1,121 @@
+import heapq
+
+
+class HostScheduler(object):
+    """
+    Per-host priority queues plus two heaps of hosts: hosts in cooldown keyed
+    on the time they are next allowed to be fetched, and hosts out of
+    cooldown keyed on the score of their best item. pop() serves the best
+    item of the best host that is out of cooldown, in O(log n). Items of
+    equal score come out in the order they were pushed. Not thread safe;
+    the Frontier guards it.
+
+    Each host is a token bucket holding at most one token, refilled `delay`
+    seconds after it is taken (or the host's own delay, if longer). A
+    larger bucket would let a host that was idle take a burst of fetches,
+    which the cache server counts as impolite.
+
+    A blocked host is not served at all until it is unblocked, such as
+    while its robots.txt is being fetched.
+    """
+    def __init__(self, delay):
+        self.delay = delay
+        self.delays = {}  # host -> its own delay, when longer than `delay`
+        self.queues = {}  # host -> heap of (score, seq, item)
+        self.next_allowed = {}  # host -> earliest time of the next fetch
+        self.waiting = []  # (next allowed time, host) of hosts in cooldown
+        # (score, seq, host) of hosts out of cooldown, keyed on their best
+        # item when pushed. Entries that no longer match are skipped.
+        self.ready = []
+        self.is_ready = {}  # host -> whether it is out of cooldown
+        self.blocked = set()
+        # Blocked hosts with queued items, in neither heap.
+        self.parked = set()
+        self.seq = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def push(self, host, item, score=0):
+        self.seq += 1
+        entry = (score, self.seq, item)
+        queue = self.queues.get(host)
+        if queue is None:
+            self.queues[host] = [entry]
+            self.is_ready[host] = False
+            heapq.heappush(
+                self.waiting, (self.next_allowed.get(host, 0), host))
+        else:
+            heapq.heappush(queue, entry)
+            if self.is_ready[host] and queue[0] is entry:
+                heapq.heappush(self.ready, (score, self.seq, host))
+        self.size += 1
+
+    def set_delay(self, host, delay):
+        """
+        Space the fetches of `host` by `delay` seconds when that is longer
+        than the default, starting with its next fetch.
+        """
+        if delay is not None and delay > self.delay:
+            self.delays[host] = delay
+        else:
+            self.delays.pop(host, None)
+
+    def block(self, host):
+        self.blocked.add(host)
+
+    def unblock(self, host):
+        self.blocked.discard(host)
+        if host in self.parked:
+            self.parked.remove(host)
+            heapq.heappush(
+                self.waiting, (self.next_allowed.get(host, 0), host))
+
+    def items(self):
+        """Every queued (score, seq, item), in no particular order."""
+        for queue in self.queues.values():
+            yield from queue
+
+    def cooling(self, now):
+        """Number of hosts with queued items that are still in cooldown."""
+        return sum(1 for ready_at, _ in self.waiting if ready_at > now)
+
+    def pop(self, now):
+        """
+        Returns (item, 0) for the best item whose host is out of cooldown,
+        (None, wait) if every queued host is cooling down for at least
+        `wait` more seconds, or (None, None) if nothing is queued or every
+        queued host is blocked.
+        """
+        while self.waiting and self.waiting[0][0] <= now:
+            _, host = heapq.heappop(self.waiting)
+            if host in self.blocked:
+                self.parked.add(host)
+                continue
+            self.is_ready[host] = True
+            score, seq, _ = self.queues[host][0]
+            heapq.heappush(self.ready, (score, seq, host))
+        while self.ready:
+            _, seq, host = heapq.heappop(self.ready)
+            queue = self.queues.get(host)
+            if not self.is_ready.get(host) or queue[0][1] != seq:
+                continue  # stale entry
+            if host in self.blocked:
+                self.is_ready[host] = False
+                self.parked.add(host)
+                continue
+            _, _, item = heapq.heappop(queue)
+            self.size -= 1
+            ready_at = now + self.delays.get(host, self.delay)
+            self.next_allowed[host] = ready_at
+            if queue:
+                self.is_ready[host] = False
+                heapq.heappush(self.waiting, (ready_at, host))
+            else:
+                del self.queues[host]
+                del self.is_ready[host]
+            return item, 0
+        if self.waiting:
+            return None, self.waiting[0][0] - now
+        return None, None
@@ -0,0 +1,357 @@
+import copy
+import multiprocessing
+import os
+import queue
+import time
+from bisect import bisect
+from collections import defaultdict
+from hashlib import blake2b
+from threading import Event, Lock, Thread
+from urllib.parse import urlparse
+
+from crawler.frontier import Frontier
+from crawler.store import _escape
+from crawler.traps import TrapDetector
+from crawler.worker import Worker
+from utils import get_logger
+from utils.archive import ResponseRecorder
+from utils.log_queue import log_queue
+from utils.profiler import profiler
+from utils.stats import CrawlStats
+import scraper
+
+
+class HashRing(object):
+    """
+    Consistent hash of hosts onto `shards` shards, with `replicas` points
+    per shard on the ring so hosts spread evenly and changing the number of
+    shards moves few hosts.
+    """
+    def __init__(self, shards, replicas=64):
+        points = sorted(
+            (self._hash(f"{shard}-{replica}"), shard)
+            for shard in range(shards) for replica in range(replicas))
+        self.points = [point for point, _ in points]
+        self.shards = [shard for _, shard in points]
+
+    @staticmethod
+    def _hash(key):
+        return int.from_bytes(
+            blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+
+    def shard(self, url):
+        host = urlparse(url).netloc.lower()
+        index = bisect(self.points, self._hash(host)) % len(self.points)
+        return self.shards[index]
+
+
+def save_inbox(save_file, links):
+    """Append (url, depth) links to the inbox file of a shard's save file."""
+    with open(f"{save_file}.inbox", "a", encoding="utf-8", newline="\n") as f:
+        f.writelines(f"{depth}\t{_escape(url)}\n" for url, depth in links)
+
+
+def load_inbox(save_file):
+    """The (url, depth) links of the inbox file of a shard's save file."""
+    name = f"{save_file}.inbox"
+    if not os.path.exists(name):
+        return
+    with open(name, "r", encoding="utf-8", newline="\n") as f:
+        for line in f:
+            if not line.endswith("\n"):
+                break
+            depth, url = line[:-1].split("\t", 1)
+            yield url, int(depth)
+
+
+class ShardFrontier(Frontier):
+    """
+    The frontier of one crawl process. It keeps the urls of the hosts its
+    shard owns, so each host's politeness is tracked in exactly one process.
+    Urls of other shards are batched per shard and put on that shard's
+    inbox queue once SHARDBATCH are waiting, or when the coordinator probes.
+
+    A receiver thread adds the batches arriving on this shard's inbox and
+    answers probes with (idle, batches sent, batches received). Workers wait
+    for more urls until the coordinator sets `finished`, so is_drained()
+    here means the whole crawl is done.
+
+    On close the receiver stops before the save file is closed, and the
+    outboxes are sent. Batches left on the inboxes are saved by the
+    coordinator to "<SAVE>.shard<N>.inbox", which the shard adds on its
+    next start and removes once they are in its save file.
+    """
+    def __init__(self, config, restart, shard, ring, inboxes, status,
+                 finished):
+        self.shard = shard
+        self.ring = ring
+        self.inboxes = inboxes
+        self.status = status
+        self.finished = finished
+        self.outboxes = [list() for _ in inboxes]
+        self.outbox_lock = Lock()
+        self.sent = 0
+        self.received = 0
+        self.stopping = Event()
+        super().__init__(config, restart)
+        self.inbox_file = f"{config.save_file}.inbox"
+        if restart:
+            if os.path.exists(self.inbox_file):
+                os.remove(self.inbox_file)
+        else:
+            by_depth = defaultdict(list)
+            for url, depth in load_inbox(config.save_file):
+                by_depth[depth].append(url)
+            for depth, urls in by_depth.items():
+                self.add_urls(urls, depth=depth)
+        self.receiver = Thread(target=self._receive, daemon=True)
+        self.receiver.start()
+
+    def add_urls(self, urls, parent=None, depth=None):
+        if depth is None:
+            depth = (self.in_flight.get(parent, 0) + 1
+                     if parent is not None else 0)
+        local = list()
+        full = list()
+        with self.outbox_lock:
+            if self.closed:
+                # Sent by close, or dropped like the links of Frontier.
+                return 0
+            for url in urls:
+                shard = self.ring.shard(url)
+                if shard == self.shard:
+                    local.append(url)
+                    continue
+                outbox = self.outboxes[shard]
+                outbox.append((url, depth))
+                if len(outbox) >= self.config.shard_batch:
+                    full.append(shard)
+            for shard in full:
+                self._send(shard)
+        return super().add_urls(local, depth=depth)
+
+    def _send(self, shard):
+        # Called with outbox_lock held.
+        self.inboxes[shard].put(("urls", self.outboxes[shard]))
+        self.outboxes[shard] = list()
+        self.sent += 1
+
+    def _flush(self):
+        with self.outbox_lock:
+            for shard, outbox in enumerate(self.outboxes):
+                if outbox:
+                    self._send(shard)
+
+    def _receive(self):
+        inbox = self.inboxes[self.shard]
+        while not self.stopping.is_set():
+            try:
+                message = inbox.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            kind, payload = message
+            if kind == "urls":
+                by_depth = defaultdict(list)
+                for url, depth in payload:
+                    by_depth[depth].append(url)
+                for depth, urls in by_depth.items():
+                    super().add_urls(urls, depth=depth)
+                with self.outbox_lock:
+                    self.received += 1
+            elif kind == "probe":
+                self._flush()
+                # Checked before taking outbox_lock, so the frontier lock is
+                # never held together with it.
+                idle = Frontier.is_drained(self)
+                with self.outbox_lock:
+                    sent, received = self.sent, self.received
+                self.status.put((self.shard, payload, idle, sent, received))
+
+    def get_tbd_url(self, timeout=None):
+        deadline = None if timeout is None else time.time() + timeout
+        while not (self.finished.is_set() or self.stopped or self.closed):
+            wait = 0.1
+            if deadline is not None:
+                wait = min(wait, deadline - time.time())
+                if wait <= 0:
+                    return None
+            url = super().get_tbd_url(wait)
+            if url:
+                return url
+            with self.ready:
+                # Locally drained: wait for a batch from another shard.
+                if Frontier.is_drained(self):
+                    self.ready.wait(wait)
+        return None
+
+    def is_drained(self):
+        return self.finished.is_set() or self.stopped
+
+    def close(self):
+        # Batches taken from the inbox are added while the save file is
+        # open; the rest stay on the inbox for the coordinator.
+        self.stopping.set()
+        self.receiver.join()
+        super().close()
+        # add_urls checks `closed` under outbox_lock, so nothing is added
+        # to the outboxes after this.
+        self._flush()
+        if self.loaded and os.path.exists(self.inbox_file):
+            os.remove(self.inbox_file)
+
+
+def _run_shard(config, restart, shard, worker_factory, inboxes, status,
+               finished):
+    """Entry point of a crawl process."""
+    config.save_file = f"{config.save_file}.shard{shard}"
+    if config.metrics_port:
+        config.metrics_port += shard
+    config.profile_file = f"{config.profile_file}.shard{shard}"
+    if config.archive is not None and not config.archive.replay:
+        # Record into segments of this process.
+        config.archive = ResponseRecorder(config.archive.path)
+    ring = HashRing(config.processes)
+    config.seed_urls = [
+        url for url in config.seed_urls if ring.shard(url) == shard]
+
+    from crawler import Crawler
+    def frontier_factory(config, restart):
+        return ShardFrontier(
+            config, restart, shard, ring, inboxes, status, finished)
+    crawler = Crawler(
+        config, restart, frontier_factory=frontier_factory,
+        worker_factory=worker_factory)
+    # The coordinator writes the report from the merged shard statistics.
+    scraper.stats.on_snapshot = None
+    try:
+        crawler.start()
+    except KeyboardInterrupt:
+        crawler.logger.info("Interrupted, saving shard statistics.")
+    finally:
+        scraper.stats.snapshot()
+        if config.archive is not None:
+            config.archive.close()
+        # Crawl processes exit without running atexit handlers.
+        profiler.stop()
+        log_queue.stop()
+
+
+class ShardedCrawler(object):
+    """
+    Runs PROCESSES crawl processes, each owning the hosts a HashRing assigns
+    to it with its own frontier, save file ("<SAVE>.shard<N>"), workers and
+    parse stage, so parsing and is_valid are no longer bound to one GIL.
+
+    The coordinator in this process detects the end of the crawl: every
+    0.1 seconds it probes all shards, and stops them once two consecutive
+    rounds find every shard idle with identical batch counters and as many
+    batches received as sent, which means no batch is still in transit.
+    It then merges the shard statistics and trap counters for create_report.
+    Exact and near duplicate pages are only detected within a shard.
+    Resuming needs the same number of processes.
+
+    While the shards stop it drains the inboxes, so no process blocks on
+    exit writing to a full queue, and saves the batches no shard took in,
+    such as those sent on Ctrl-C, for the owning shard's next start.
+    """
+    def __init__(self, config, restart, worker_factory=Worker):
+        self.config = config
+        self.restart = restart
+        self.worker_factory = worker_factory
+        self.logger = get_logger("CRAWLER")
+        context = multiprocessing.get_context("fork")
+        self.inboxes = [context.Queue() for _ in range(config.processes)]
+        self.status = context.Queue()
+        self.finished = context.Event()
+        self.processes = [
+            context.Process(
+                target=_run_shard, name=f"Shard-{shard}",
+                args=(config, restart, shard, worker_factory, self.inboxes,
+                      self.status, self.finished))
+            for shard in range(config.processes)]
+
+    def start(self):
+        for process in self.processes:
+            process.start()
+        try:
+            self._coordinate()
+        finally:
+            self.finished.set()
+            undelivered = [list() for _ in self.inboxes]
+            while any(process.is_alive() for process in self.processes):
+                self._drain(undelivered)
+                time.sleep(0.05)
+            for process in self.processes:
+                process.join()
+            self._drain(undelivered)
+            for shard, links in enumerate(undelivered):
+                if links:
+                    self.logger.info(
+                        f"Saving {len(links)} urls sent to shard {shard} "
+                        f"for its next start.")
+                    save_inbox(f"{self.config.save_file}.shard{shard}", links)
+            self._merge()
+
+    def _drain(self, undelivered):
+        """Move the url batches left on the inboxes into `undelivered`."""
+        for shard, inbox in enumerate(self.inboxes):
+            while True:
+                try:
+                    kind, payload = inbox.get_nowait()
+                except queue.Empty:
+                    break
+                if kind == "urls":
+                    undelivered[shard].extend(payload)
+        while True:
+            try:
+                self.status.get_nowait()
+            except queue.Empty:
+                break
+
+    def _probe(self, probe):
+        for inbox in self.inboxes:
+            inbox.put(("probe", probe))
+        answers = dict()
+        deadline = time.time() + 5
+        while len(answers) < len(self.processes):
+            try:
+                shard, answer, idle, sent, received = self.status.get(
+                    timeout=max(0.01, deadline - time.time()))
+            except queue.Empty:
+                return None
+            if answer == probe:
+                answers[shard] = (idle, sent, received)
+        return answers
+
+    def _coordinate(self):
+        previous = None
+        probe = 0
+        while True:
+            if not all(process.is_alive() for process in self.processes):
+                self.logger.error("A crawl process exited, stopping.")
+                return
+            probe += 1
+            answers = self._probe(probe)
+            done = (
+                answers is not None
+                and all(idle for idle, _, _ in answers.values())
+                and sum(sent for _, sent, _ in answers.values())
+                == sum(received for _, _, received in answers.values()))
+            if done and answers == previous:
+                self.logger.info("Every shard is drained. Stopping Crawler.")
+                return
+            previous = answers if done else None
+            time.sleep(0.1)
+
+    def _merge(self):
+        """Point scraper at the combined statistics of every shard."""
+        stats = CrawlStats(top_words=self.config.top_words_capacity)
+        merged_config = copy.copy(self.config)
+        merged_config.save_file = f"{self.config.save_file}.merged"
+        traps = TrapDetector(merged_config, True)
+        for shard in range(len(self.processes)):
+            save_file = f"{self.config.save_file}.shard{shard}"
+            stats.merge_snapshot(save_file)
+            traps.merge(f"{save_file}.traps")
+        scraper.stats = stats
+        scraper.trap_detector = traps
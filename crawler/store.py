@@ -0,0 +1,275 @@
+import dbm
+import os
+import pickle
+import shelve
+from threading import Thread, Lock, Event
+
+from utils import get_logger, get_urlhash
+from utils.fingerprint import url_fingerprint
+from utils.metrics import metrics
+from utils.profiler import profiler
+
+
+def _escape(url):
+    # Records are tab separated, one per line.
+    return url.replace("\t", "%09").replace("\n", "%0A").replace("\r", "%0D")
+
+
+# What a corrupt or foreign shelve raises when opened or read.
+SHELVE_ERRORS = (dbm.error[0], OSError, pickle.UnpicklingError, EOFError)
+
+
+class ShelveStore(object):
+    """
+    The original shelve backed save file, keyed by urlhash so existing save
+    files stay readable. Syncs are grouped every `sync_records` writes
+    instead of after every write.
+    """
+    SUFFIXES = ("", ".db", ".dat", ".dir", ".bak")
+
+    def __init__(self, config):
+        self.config = config
+        self.save = shelve.open(config.save_file)
+        self.pending = 0
+
+    @classmethod
+    def files(cls, path):
+        """The files of the save file at `path` that exist."""
+        return [
+            path + suffix for suffix in cls.SUFFIXES
+            if os.path.exists(path + suffix)]
+
+    @classmethod
+    def exists(cls, path):
+        return bool(cls.files(path))
+
+    @classmethod
+    def remove(cls, path):
+        for name in cls.files(path):
+            os.remove(name)
+
+    @staticmethod
+    def readable(path):
+        """Whether the save file at `path` opens as a shelve."""
+        try:
+            shelve.open(path, "r").close()
+        except SHELVE_ERRORS:
+            return False
+        return True
+
+    def records(self):
+        """Stream (fingerprint, url, completed) for every record."""
+        for url, completed in self.save.values():
+            yield url_fingerprint(url), url, completed
+
+    def values(self):
+        return self.save.values()
+
+    def put(self, fingerprint, url, completed):
+        self.put_many(((fingerprint, url, completed),))
+
+    def put_many(self, records):
+        for _, url, completed in records:
+            self.save[get_urlhash(url)] = (url, completed)
+            self.pending += 1
+        if (self.config.durability == "always"
+                or self.pending >= self.config.sync_records):
+            self.flush()
+
+    def flush(self):
+        with metrics.timer("store_sync"), profiler.stage("store_sync"):
+            self.save.sync()
+        self.pending = 0
+
+    def close(self):
+        self.save.close()
+
+
+class LogStore(object):
+    """
+    Append-only record log with group commit, compacted into a snapshot on
+    open once the log is as large as the snapshot. Both files hold one
+    "<completed>\t<fingerprint>\t<url>" line per record, the fingerprint
+    in hex; in the log the last record for a fingerprint wins.
+
+    Records are buffered and written by a background thread once
+    `sync_records` are pending or `sync_interval` seconds have passed.
+    DURABILITY selects what a commit means: "none" leaves the data in the OS
+    page cache, "batch" fsyncs each group commit and "always" writes and
+    fsyncs every record before put returns.
+
+    A shelve save file at the same path, from before STORE was switched to
+    "log", is imported into the snapshot on the first open and left in
+    place; it counts as this store's save file until then. One that cannot
+    be read is skipped with a warning, and counts as no save file at all.
+    """
+    def __init__(self, config):
+        self.config = config
+        self.snapshot_file = f"{config.save_file}.snapshot"
+        self.log_file = f"{config.save_file}.log"
+        self.lock = Lock()  # Guards buffer
+        self.write_lock = Lock()  # Serializes writes to the log file
+        self.buffer = list()
+        if (not self.files(config.save_file)
+                and ShelveStore.exists(config.save_file)):
+            self._import_shelve()
+        self._compact()
+        self.log = open(self.log_file, "ab")
+        self.closed = Event()
+        self.wakeup = Event()
+        self.flusher = Thread(target=self._flush_loop, daemon=True)
+        self.flusher.start()
+
+    @staticmethod
+    def files(path):
+        """The files of the save file at `path` that exist."""
+        return [
+            name for name in (f"{path}.snapshot", f"{path}.log")
+            if os.path.exists(name)]
+
+    @classmethod
+    def exists(cls, path):
+        return bool(cls.files(path)) or (
+            ShelveStore.exists(path) and ShelveStore.readable(path))
+
+    @classmethod
+    def remove(cls, path):
+        for name in cls.files(path):
+            os.remove(name)
+        # Or a restart would import the old shelve again.
+        if ShelveStore.exists(path):
+            ShelveStore.remove(path)
+
+    def _import_shelve(self):
+        tmp_file = f"{self.snapshot_file}.tmp"
+        try:
+            save = shelve.open(self.config.save_file, "r")
+            try:
+                with open(tmp_file, "w", encoding="utf-8",
+                          newline="\n") as f:
+                    f.writelines(
+                        f"{int(completed)}\t{url_fingerprint(url).hex()}\t"
+                        f"{_escape(url)}\n"
+                        for url, completed in save.values())
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_file, self.snapshot_file)
+            finally:
+                save.close()
+        except SHELVE_ERRORS as e:
+            get_logger("FRONTIER").warning(
+                f"Could not import the shelve save file "
+                f"{self.config.save_file} ({e!r}), starting from seed.")
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+
+    def _read(self, name):
+        if not os.path.exists(name):
+            return
+        with open(name, "r", encoding="utf-8", newline="\n") as f:
+            for line in f:
+                if not line.endswith("\n"):
+                    # Torn write at the tail of the log after a crash.
+                    break
+                completed, key, url = line[:-1].split("\t", 2)
+                yield key, url, completed == "1"
+
+    def _compact(self):
+        """
+        Fold the log into a new snapshot and truncate the log, once the log
+        is as large as the snapshot; rewriting a large snapshot for a short
+        log would dominate the time to resume.
+        """
+        if not os.path.exists(self.log_file):
+            return
+        log_size = os.path.getsize(self.log_file)
+        if not log_size:
+            return
+        if (os.path.exists(self.snapshot_file)
+                and log_size < os.path.getsize(self.snapshot_file)):
+            return
+        records = dict()
+        for name in (self.snapshot_file, self.log_file):
+            for key, url, completed in self._read(name):
+                records[key] = (url, completed)
+        tmp_file = f"{self.snapshot_file}.tmp"
+        with open(tmp_file, "w", encoding="utf-8", newline="\n") as f:
+            f.writelines(
+                f"{int(completed)}\t{key}\t{url}\n"
+                for key, (url, completed) in records.items())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.snapshot_file)
+        os.remove(self.log_file)
+
+    def records(self):
+        """Stream (fingerprint, url, completed) for every record."""
+        self.flush()
+        # The log is at most as large as the snapshot; its records supersede
+        # the snapshot, which is streamed without being held in memory.
+        newer = {
+            key: (url, completed)
+            for key, url, completed in self._read(self.log_file)}
+        for key, url, completed in self._read(self.snapshot_file):
+            if key not in newer:
+                yield bytes.fromhex(key), url, completed
+        for key, (url, completed) in newer.items():
+            yield bytes.fromhex(key), url, completed
+
+    def values(self):
+        """Stream (url, completed) for every record."""
+        return ((url, completed) for _, url, completed in self.records())
+
+    def put(self, fingerprint, url, completed):
+        self.put_many(((fingerprint, url, completed),))
+
+    def put_many(self, records):
+        lines = [
+            f"{int(completed)}\t{fingerprint.hex()}\t{_escape(url)}\n"
+            for fingerprint, url, completed in records]
+        with self.lock:
+            self.buffer.extend(lines)
+            pending = len(self.buffer)
+        if self.config.durability == "always":
+            self.flush()
+        elif pending >= self.config.sync_records:
+            self.wakeup.set()
+
+    def flush(self):
+        # Swap the buffer out so puts are not blocked behind the fsync.
+        with self.write_lock:
+            with self.lock:
+                if not self.buffer:
+                    return
+                data = "".join(self.buffer).encode("utf-8")
+                self.buffer = list()
+            with metrics.timer("store_sync"), profiler.stage("store_sync"):
+                self.log.write(data)
+                self.log.flush()
+                if self.config.durability != "none":
+                    os.fsync(self.log.fileno())
+
+    def _flush_loop(self):
+        while not self.closed.is_set():
+            self.wakeup.wait(self.config.sync_interval)
+            self.wakeup.clear()
+            self.flush()
+
+    def close(self):
+        self.closed.set()
+        self.wakeup.set()
+        self.flusher.join()
+        self.flush()
+        self.log.close()
+
+
+STORES = {"shelve": ShelveStore, "log": LogStore}
+
+
+def get_store_class(config):
+    try:
+        return STORES[config.store]
+    except KeyError:
+        raise ValueError(
+            f"Unknown frontier STORE {config.store!r}, "
+            f"expected one of {', '.join(STORES)}.")
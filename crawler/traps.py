@@ -0,0 +1,113 @@
+import json
+import os
+import re
+import time
+from collections import defaultdict
+from threading import Lock
+from urllib.parse import urlsplit
+
+DIGITS_RE = re.compile(r"\d+")
+
+
+class _Shard(object):
+    def __init__(self):
+        self.lock = Lock()
+        self.admitted = defaultdict(int)
+        self.rejected = defaultdict(int)
+
+
+class TrapDetector(object):
+    """
+    Caps how many urls the frontier admits per path pattern (the url path
+    with every run of digits replaced by N), so calendars, paginated
+    listings and similar traps cannot flood the frontier.
+
+    Only urls that are new to the frontier are counted. Counters are split
+    across shards, each with its own lock, and are saved to
+    "<SAVE>.traps" so a resumed crawl keeps its limits.
+    """
+    SHARDS = 16
+
+    def __init__(self, config, restart):
+        self.limit = config.trap_limit
+        self.save_file = f"{config.save_file}.traps"
+        self.shards = [_Shard() for _ in range(self.SHARDS)]
+        self.save_lock = Lock()
+        self.last_save = time.time()
+        if restart and os.path.exists(self.save_file):
+            os.remove(self.save_file)
+        elif not restart:
+            self._load()
+
+    @staticmethod
+    def pattern(url):
+        return DIGITS_RE.sub("N", urlsplit(url).path)
+
+    def _shard(self, pattern):
+        return self.shards[hash(pattern) % self.SHARDS]
+
+    def admit(self, url):
+        """
+        Count a new url against its pattern. Returns how many urls the
+        pattern has admitted including this one, or 0 once over the limit.
+        """
+        pattern = self.pattern(url)
+        shard = self._shard(pattern)
+        with shard.lock:
+            if shard.admitted[pattern] >= self.limit:
+                shard.rejected[pattern] += 1
+                return 0
+            shard.admitted[pattern] += 1
+            return shard.admitted[pattern]
+
+    def top_trapped(self, count=20):
+        """Patterns that rejected the most urls, as (pattern, rejected)."""
+        rejected = list()
+        for shard in self.shards:
+            with shard.lock:
+                rejected.extend(shard.rejected.items())
+        rejected.sort(key=lambda item: item[1], reverse=True)
+        return rejected[:count]
+
+    def _load(self):
+        self.merge(self.save_file)
+
+    def merge(self, save_file):
+        """Add the counters saved in `save_file`, if it exists."""
+        if not os.path.exists(save_file):
+            return
+        with open(save_file, "r", encoding="utf-8") as f:
+            counters = json.load(f)
+        for pattern, (admitted, rejected) in counters.items():
+            shard = self._shard(pattern)
+            with shard.lock:
+                shard.admitted[pattern] += admitted
+                if rejected:
+                    shard.rejected[pattern] += rejected
+
+    def save(self):
+        with self.save_lock:
+            self._save()
+
+    def _save(self):
+        counters = dict()
+        for shard in self.shards:
+            with shard.lock:
+                for pattern, admitted in shard.admitted.items():
+                    counters[pattern] = (
+                        admitted, shard.rejected.get(pattern, 0))
+        tmp_file = f"{self.save_file}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(counters, f)
+        os.replace(tmp_file, self.save_file)
+        self.last_save = time.time()
+
+    def save_every(self, interval):
+        """Save if more than `interval` seconds passed since the last save."""
+        if time.time() - self.last_save > interval:
+            # Skip if another thread is already saving.
+            if self.save_lock.acquire(blocking=False):
+                try:
+                    self._save()
+                finally:
+                    self.save_lock.release()
@@ -1,22 +1,53 @@
-from threading import Thread
 import time
+from threading import Thread
 from inspect import getsource
+from urllib.parse import urlparse
 from utils.download import download
 from utils import get_logger
+from utils.log_queue import log_queue
+from utils.metrics import metrics
+from utils.profiler import profiler
 import scraper
 
+# scraper.py does not change while crawling, so every worker after the first
+# skips reading its source again.
+_scraper_checked = False
+
+def check_scraper():
+    # Basic check for requests in scraper
+    global _scraper_checked
+    if _scraper_checked:
+        return
+    source = getsource(scraper)
+    assert {source.find(req) for req in {"from requests import", "import requests"}} == {-1}, \
+        "Do not use requests in scraper.py"
+    assert {source.find(req) for req in {"from urllib.request import", "import urllib.request"}} == {-1}, \
+        "Do not use urllib.request in scraper.py"
+    _scraper_checked = True
+
+def record_download(url, resp, seconds):
+    """Count a finished download in the crawl metrics and crawl log."""
+    metrics.observe("download", seconds)
+    metrics.count("pages")
+    metrics.count("responses", labels=(urlparse(url).netloc, resp.status))
+    content = getattr(resp.raw_response, "content", None)
+    log_queue.event({
+        "time": round(time.time(), 3),
+        "url": url,
+        "status": resp.status,
+        "bytes": len(content) if content else 0,
+        "seconds": round(seconds, 4)})
+
 class Worker(Thread):
-    def __init__(self, worker_id, config, frontier):
+    def __init__(self, worker_id, config, frontier, parse_stage=None):
         self.logger = get_logger(f"Worker-{worker_id}", "Worker")
         self.config = config
         self.frontier = frontier
         self.worker_id = worker_id
-        
-        # Basic check for requests in scraper
-        assert {getsource(scraper).find(req) for req in {"from requests import", "import requests"}} == {-1}, \
-            "Do not use requests in scraper.py"
-        assert {getsource(scraper).find(req) for req in {"from urllib.request import", "import urllib.request"}} == {-1}, \
-            "Do not use urllib.request in scraper.py"
+        # Optional crawler.pipeline.ParseStage that parses pages in other
+        # processes; without it pages are scraped in this thread.
+        self.parse_stage = parse_stage
+        check_scraper()
         
         super().__init__(daemon=True)
         
@@ -24,46 +55,48 @@ class Worker(Thread):
         """
         Main worker loop that respects politeness and thread safety.
         """
-        consecutive_none_count = 0
-        max_consecutive_none = 10  # Stop after 10 consecutive failed attempts
-        
         while True:
-            tbd_url = self.frontier.get_tbd_url()
-            
+            # Blocks until a domain is out of cooldown or new urls arrive;
+            # None means every url has been downloaded and processed.
+            with profiler.stage("frontier"):
+                tbd_url = self.frontier.get_tbd_url()
             if not tbd_url:
-                # Check if frontier is truly empty or just in politeness cooldown
-                if not self.frontier.has_pending_urls():
-                    self.logger.info("Frontier is empty. Stopping Crawler.")
-                    break
+                self.logger.info("Frontier is empty. Stopping Crawler.")
+                break
+            
+            handed_off = False
+            try:
+                # Download and process the URL
+                start = time.perf_counter()
+                with profiler.stage("download"):
+                    resp = download(tbd_url, self.config, self.logger)
+                record_download(tbd_url, resp, time.perf_counter() - start)
+                self.logger.info(
+                    f"Downloaded {tbd_url}, status <{resp.status}>, "
+                    f"using cache {self.config.cache_server}.",
+                    extra={"url": tbd_url})
+                
+                if self.parse_stage:
+                    # The parse stage adds the links and completes the url.
+                    with profiler.stage("submit"):
+                        self.parse_stage.submit(tbd_url, resp, self.frontier)
+                    handed_off = True
                 else:
-                    # URLs exist but all domains are in cooldown
-                    consecutive_none_count += 1
-                    if consecutive_none_count >= max_consecutive_none:
-                        self.logger.info("All domains in cooldown for too long. Stopping.")
-                        break
+                    # Scrape URLs from the response
+                    with profiler.stage("scrape"):
+                        scraped_urls = scraper.scraper(tbd_url, resp)
                     
-                    # Sleep briefly and retry
-                    time.sleep(0.1)
-                    continue
-            
-            # Reset consecutive none count
-            consecutive_none_count = 0
-            
-            # Download and process the URL
-            resp = download(tbd_url, self.config, self.logger)
-            self.logger.info(
-                f"Downloaded {tbd_url}, status <{resp.status}>, "
-                f"using cache {self.config.cache_server}.")
-            
-            # Scrape URLs from the response
-            scraped_urls = scraper.scraper(tbd_url, resp)
-            
-            # Add scraped URLs to frontier
-            for scraped_url in scraped_urls:
-                self.frontier.add_url(scraped_url)
-            
-            # Mark URL as complete
-            self.frontier.mark_url_complete(tbd_url)
+                    # Add scraped URLs to frontier in one batch
+                    with profiler.stage("add_urls"):
+                        self.frontier.add_urls(scraped_urls, parent=tbd_url)
+            except Exception as e:
+                self.logger.error(f"Failed to process {tbd_url}: {e}")
+            finally:
+                # Mark URL as complete, even on failure, so the frontier can
+                # tell a drained crawl apart from one that is still busy.
+                if not handed_off:
+                    with profiler.stage("complete"):
+                        self.frontier.mark_url_complete(tbd_url)
             
             # Note: We don't sleep here because the frontier already handles
             # politeness delays in get_tbd_url()
\ No newline at end of file
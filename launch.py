@@ -1,25 +1,75 @@
 import multiprocessing
+import time
 # CRITICAL FIX FOR MACOS: Set start method to 'fork' before any other imports
 # This must be done before importing spacetime/crawler modules
 if __name__ == "__main__":
     multiprocessing.set_start_method('fork', force=True)
+STARTED = time.perf_counter()
 
 from configparser import ConfigParser
 from argparse import ArgumentParser
 
-from utils.server_registration import get_cache_server
+from utils import get_logger
+from utils.server_registration import Registration
 from utils.config import Config
+from utils.log_queue import log_queue
+from utils.startup import StartupProfile
 from crawler import Crawler
+from crawler.worker import Worker
 from scraper import create_report
 
 
-def main(config_file, restart):
+def main(config_file, restart, record=None, replay=None,
+         profile_startup=False):
+    startup = StartupProfile(profile_startup, STARTED)
+    startup.mark("imports")
     cparser = ConfigParser()
     cparser.read(config_file)
     config = Config(cparser)
-    config.cache_server = get_cache_server(config, restart)
-    crawler = Crawler(config, restart)
-    crawler.start()
+    log_queue.configure(config)
+    startup.mark("config")
+    registration = None
+    if replay:
+        from utils.archive import ResponseReplayer
+        # Pages come from disk: no cache server and no politeness delay.
+        config.archive = ResponseReplayer(replay)
+        config.time_delay = 0
+    else:
+        # Register while the frontier loads; only the workers need the
+        # cache server.
+        registration = Registration(config, restart)
+        if record:
+            from utils.archive import ResponseRecorder
+            config.archive = ResponseRecorder(record)
+    # Only import the crawl modes in use.
+    worker_factory = Worker
+    if config.fetch_mode == "async":
+        from crawler.async_worker import AsyncWorker as worker_factory
+    crawler_factory = Crawler
+    if config.processes > 1:
+        from crawler.sharded import ShardedCrawler as crawler_factory
+
+    def register():
+        config.cache_server = registration.cache_server()
+        startup.mark("registration wait")
+        startup.add("registration (background)", registration.seconds)
+    if registration is not None and restart:
+        # Starting over deletes the save file, so not before the cache
+        # server has accepted the user agent.
+        register()
+    crawler = crawler_factory(config, restart, worker_factory=worker_factory)
+    startup.mark("crawler setup")
+    if registration is not None and not restart:
+        register()
+    startup.report(get_logger("STARTUP"))
+    try:
+        crawler.start()
+    except KeyboardInterrupt:
+        # Still write a report of everything crawled so far.
+        crawler.logger.info("Interrupted, writing report.")
+    finally:
+        if config.archive is not None:
+            config.archive.close()
     create_report()
 
 
@@ -27,5 +77,16 @@ if __name__ == "__main__":
     parser = ArgumentParser()
     parser.add_argument("--restart", action="store_true", default=False)
     parser.add_argument("--config_file", type=str, default="config.ini")
+    parser.add_argument(
+        "--profile-startup", action="store_true", default=False,
+        help="log how long each startup phase took")
+    archive = parser.add_mutually_exclusive_group()
+    archive.add_argument(
+        "--record", type=str, metavar="DIR",
+        help="save every downloaded response in an archive directory")
+    archive.add_argument(
+        "--replay", type=str, metavar="DIR",
+        help="download from an archive made with --record, offline")
     args = parser.parse_args()
-    main(args.config_file, args.restart)
\ No newline at end of file
+    main(args.config_file, args.restart, args.record, args.replay,
+         args.profile_startup)
\ No newline at end of file
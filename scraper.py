@@ -1,10 +1,14 @@
-import hashlib
-import re
-import time
-from bs4 import BeautifulSoup
-from collections import Counter, defaultdict
+import os
+from collections import Counter
 from urllib.parse import urlparse, urljoin, urlsplit, urldefrag
-import threading
+from utils.fingerprint import content_fingerprint, url_fingerprint
+from utils.html_scan import scan
+from utils.metrics import metrics
+from utils.page_gate import PageGate
+from utils.profiler import profiler
+from utils.simhash import simhash
+from utils.stats import CrawlStats
+from utils.url_filter import UrlFilter, rules_from_config
 
 stop_words = {
     "a", "about", "above", "after", "again", "against", "all", "am", "an", "and",
@@ -28,55 +32,99 @@ stop_words = {
     "yourself", "yourselves"
 }
 
-duplicate_hashes = set()
-page_word_count = {}
-subdomain_unique_pages = defaultdict(int)
-total_word_count = Counter()
-unique_pages = set()
-visited = defaultdict(int)
+# Report statistics, shared by every worker thread. configure() replaces this
+# in-memory instance with one that snapshots to disk next to the save file.
+stats = CrawlStats()
+# Set by the Crawler so reports can list the frontier's trapped patterns.
+trap_detector = None
+# Skips pages too large, not html or mostly markup.
+# configure() applies the limits of the config.
+page_gate = PageGate()
+# Set by the Crawler to the frontier's RobotsCache, which takes in the
+# robots.txt and sitemap downloads instead of this module.
+robots = None
 
-def count_words(resp):
-    try:
-        soup = BeautifulSoup(resp.raw_response.content, "html.parser")
-        for script in soup(["script", "style"]):
-            script.decompose()
-
-        text = " ".join(soup.stripped_strings)
-        words = [
-            w.lower()
-            for w in re.findall(r"\b\w+\b", text)
-            if w.lower() not in stop_words and len(w) > 1
-        ]
-        page_word_count[resp.url] = len(words)
-        total_word_count.update(words)
-    except Exception as e:
-        print(f"Error counting words on {resp.url}: {str(e)}")
+def count_words(tokens):
+    """Words worth counting: lowercased, without stop words or single letters."""
+    return [
+        w for w in (token.lower() for token in tokens)
+        if w not in stop_words and len(w) > 1
+    ]
 
-def scraper(url, resp):
+def admit_page(url, resp):
+    """
+    Record a downloaded page as unique and return its content, or None if it
+    should not be parsed.
+    """
+    if robots is not None and robots.handles(url):
+        robots.ingest(url, resp)
+        return None
     if resp.status != 200 or resp.raw_response is None:
-        return []
-    
-    # Detect and avoid sets of similar pages with no information
-    hash = hashlib.md5(resp.raw_response.content).hexdigest()
-    if hash in duplicate_hashes:
-        return []
-    duplicate_hashes.add(hash)
+        return None
+    content = resp.raw_response.content
+    reason = page_gate.reject(resp.raw_response, content)
+    if reason:
+        metrics.count("skipped", labels=(reason,))
+        return None
 
-    # How many unique pages did you find?
+    # Detect and avoid sets of similar pages with no information, and count
+    # unique pages in total and per subdomain.
     parsed = urlparse(url)
     base_url = urlsplit(url)._replace(fragment='', query='').geturl()  # remove fragment & query
-    unique_pages.add(base_url)
+    subdomain = parsed.netloc if 'uci.edu' in parsed.netloc else None
+    if not stats.admit(
+            content_fingerprint(content), url_fingerprint(base_url), subdomain):
+        return None
 
-    # the number of unique pages detected in each subdomain
-    if 'uci.edu' in parsed.netloc:
-        subdomain_unique_pages[parsed.netloc] += 1
+    return content
 
-    count_words(resp)
+def parse_page(url, content):
+    """
+    Parse a page without touching any shared state, so it can run in another
+    process. Links and words come from a single pass over the html.
+    Returns (links, word counts, total words, simhash of the words), the
+    simhash being None for a page without words.
+    """
+    try:
+        hrefs, tokens = scan(content)
+    except Exception as e:
+        print(f"Error parsing {url}: {str(e)}")
+        return [], Counter(), 0, None
+    word_counts = Counter(count_words(tokens))
+    word_total = sum(word_counts.values())
+    fingerprint = simhash(word_counts) if word_total else None
+    return resolve_links(url, hrefs), word_counts, word_total, fingerprint
+
+def record_page(url, word_counts, word_total, fingerprint):
+    """
+    Merge the word statistics of one parsed page into the report. Returns
+    False, without recording anything, for a near duplicate of a page
+    already crawled; its links should not be followed.
+    """
+    # Pages that differ from one already crawled only by a timestamp,
+    # revision or page number are near duplicates by SimHash.
+    if (fingerprint is not None
+            and stats.near_duplicates.check_and_add(fingerprint)):
+        return False
+    stats.record(url, word_counts, word_total)
+    return True
 
-    links = extract_next_links(url, resp)
-    time.sleep(0.5)
+def filter_links(links):
     return [link for link in links if is_valid(link)]
 
+def scraper(url, resp):
+    with profiler.stage("admit"):
+        content = admit_page(url, resp)
+    if content is None:
+        return []
+
+    with metrics.timer("parse"), profiler.stage("parse"):
+        links, word_counts, word_total, fingerprint = parse_page(url, content)
+    if not record_page(url, word_counts, word_total, fingerprint):
+        return []
+    with profiler.stage("is_valid"):
+        return filter_links(links)
+
 def extract_next_links(url, resp):
     # Implementation required.
     # url: the URL that was used to get the page
@@ -87,93 +135,84 @@ def extract_next_links(url, resp):
     #         resp.raw_response.url: the url, again
     #         resp.raw_response.content: the content of the page!
     # Return a list with the hyperlinks (as strings) scrapped from resp.raw_response.content
-    resp_links = []
-
     if resp.status != 200 or resp.raw_response is None:
-        return resp_links
-    
+        return []
     content = resp.raw_response.content
     if not content or len(content) == 0:
-        return resp_links
+        return []
+    hrefs, _ = scan(content)
+    return resolve_links(url, hrefs)
 
-    soup = BeautifulSoup(content, "html.parser")
-    for tag in soup.find_all("a", href=True):
-        link = urljoin(url, tag["href"])
+def resolve_links(url, hrefs):
+    resp_links = []
+    for href in hrefs:
+        try:
+            link = urljoin(url, href)
+        except ValueError:
+            continue
         defragged, _ = urldefrag(link)  # remove fragments?
         resp_links.append(defragged)
-
     return resp_links
 
+# Static url rules, compiled once into url_filter. Any of them can be replaced
+# from a [FILTER] section of the config file (see configure).
+TRAP_PATTERNS = [
+    r"wics\.ics\.uci\.edu/events/20",
+    r"\?share=(facebook|twitter)",
+    r"\?action=login",
+    r"action=diff&version=",
+    r"timeline\?from",
+    r"\?version=(?!1$)",
+    r"/calendar/",
+    r"/archive/",
+    r"/ml/datasets.php",
+    r"/print/",
+    r"/rss/",
+    r"/feed/",
+    r"/tags/",
+    r"/404",
+    r"/auth",
+    r"/~eppstein/pix/",
+    r"/~eppstein/pubs",
+    r"/category/page/\d+"
+]
+
+# (host suffix, path prefix)
+ALLOWED_DOMAINS = [
+    ("ics.uci.edu", ""),
+    ("cs.uci.edu", ""),
+    ("informatics.uci.edu", ""),
+    ("stat.uci.edu", ""),
+    ("today.uci.edu", "/department/information_computer_sciences/")
+]
+
+BLOCKED_EXTENSIONS = [
+    "css", "js", "bmp", "gif", "jpg", "jpeg", "ico",
+    "png", "tif", "tiff", "mid", "mp2", "mp3", "mp4",
+    "wav", "avi", "mov", "mpeg", "ram", "m4v", "mkv", "ogg", "ogv", "pdf",
+    "ps", "eps", "tex", "ppt", "pptx", "doc", "docx", "xls", "xlsx", "names",
+    "data", "dat", "exe", "bz2", "tar", "msi", "bin", "7z", "psd", "dmg", "iso",
+    "epub", "dll", "cnf", "tgz", "sha1",
+    "thmx", "mso", "arff", "rtf", "jar", "csv",
+    "rm", "smil", "wmv", "swf", "wma", "zip", "rar", "gz", "mpg", "img", "war",
+    "apk", "py", "ppsx", "pps"
+]
+
 def is_valid(url):
     # Decide whether to crawl this url or not. 
     # If you decide to crawl it, return True; otherwise return False.
     # There are already some conditions that return False.
     try:
-        parsed = urlparse(url)
-        if parsed.scheme not in {"http", "https"}:
-            return False
-        
-        # Detect and avoid infinite traps
-        path_depth = parsed.path.split('/')
-        if len(path_depth) > 8:
-            return False
-        
-        # pattern based checks
-        for p in [
-            re.compile(p) for p in [
-                r"wics\.ics\.uci\.edu/events/20",
-                r"\?share=(facebook|twitter)",
-                r"\?action=login",
-                r"action=diff&version=",
-                r"timeline\?from",
-                r"\?version=(?!1$)",
-                r"/calendar/",
-                r"/archive/",
-                r"/ml/datasets.php",
-                r"/print/",
-                r"/rss/",
-                r"/feed/",
-                r"/tags/",
-                r"/404",
-                r"/auth", 
-                r"/~eppstein/pix/", 
-                r"/~eppstein/pubs",
-                r"/category/page/\d+"
-            ]
-        ]:
-            if p.search(url):
-                return False
-        
-        path_pattern = re.sub(r'\d+', 'N', parsed.path)
-        visited[path_pattern] += 1
-        if visited[path_pattern] > 30:
-            return False
-        
-        if not any(p.match(url) for p in [
-            re.compile(r".*\.ics\.uci\.edu/.*"), 
-            re.compile(r".*\.cs\.uci\.edu/.*"), 
-            re.compile(r".*\.informatics\.uci\.edu/.*"), 
-            re.compile(r".*\.stat\.uci\.edu/.*"), 
-            re.compile(r".*today\.uci\.edu/department/information_computer_sciences/.*")
-        ]):
-            return False
-        
-        # parsing based checks
-        if not is_valid_helper(url):
-            return False
-
-        return not re.match(
-            r".*\.(css|js|bmp|gif|jpe?g|ico"
-            + r"|png|tiff?|mid|mp2|mp3|mp4"
-            + r"|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf"
-            + r"|ps|eps|tex|ppt|pptx|doc|docx|xls|xlsx|names"
-            + r"|data|dat|exe|bz2|tar|msi|bin|7z|psd|dmg|iso"
-            + r"|epub|dll|cnf|tgz|sha1"
-            + r"|thmx|mso|arff|rtf|jar|csv"
-            + r"|rm|smil|wmv|swf|wma|zip|rar|gz|mpg|img|war|apk|py|ppsx|pps)$", parsed.path.lower())
+        # static checks, including is_valid_helper, cached per url.
+        # Repetitive path patterns are capped by the frontier's
+        # TrapDetector, which only counts urls it admits.
+        if metrics.sampled("is_valid"):
+            with metrics.timer("is_valid"):
+                return url_filter.allowed(url)
+        return url_filter.allowed(url)
 
     except TypeError:
-        print ("TypeError for ", parsed)
+        print ("TypeError for ", url)
         raise
 
 def is_valid_helper(url):
@@ -185,9 +224,9 @@ def is_valid_helper(url):
 
     invalid_prefixes = ("http://www.ics.uci.edu/~eppstein/pix/",)
 
-    if any(url.endswith(suffix) for suffix in invalid_suffixes):
+    if url.endswith(invalid_suffixes):
         return False
-    if any(url.startswith(prefix) for prefix in invalid_prefixes):
+    if url.startswith(invalid_prefixes):
         return False
 
     if url.startswith("https://wics.ics.uci.edu/events/"):
@@ -211,28 +250,70 @@ def is_valid_helper(url):
 
     return True
 
+url_filter = UrlFilter(
+    TRAP_PATTERNS, ALLOWED_DOMAINS, BLOCKED_EXTENSIONS, check=is_valid_helper)
+
+def configure(config, restart):
+    """
+    Rebuild url_filter from the [FILTER] rules of the config, if any, and
+    set up report statistics that snapshot next to the save file.
+    """
+    global url_filter
+    traps, domains, extensions = rules_from_config(
+        config.filter_rules, TRAP_PATTERNS, ALLOWED_DOMAINS,
+        BLOCKED_EXTENSIONS)
+    url_filter = UrlFilter(traps, domains, extensions, check=is_valid_helper)
+
+    global stats
+    stats = CrawlStats(
+        config.save_file, restart,
+        snapshot_every=config.stats_snapshot_pages,
+        top_words=config.top_words_capacity,
+        near_duplicate_distance=config.near_duplicate_distance,
+        near_duplicate_capacity=config.near_duplicate_capacity,
+        on_snapshot=write_report)
+
+    global page_gate
+    page_gate = PageGate(
+        max_bytes=config.max_page_bytes, min_text_ratio=config.min_text_ratio)
+
 def create_report():
-    with open("report.txt", 'w', encoding='utf-8') as f:
+    stats.snapshot()
+    write_report()
+
+def write_report():
+    trapped = trap_detector.top_trapped() if trap_detector else ()
+    with open("report.txt.tmp", 'w', encoding='utf-8') as f:
         f.write("unique pages:\n")
-        f.write(f"{len(unique_pages)}\n\n")
+        f.write(f"{len(stats.unique_pages)}\n\n")
 
-        if page_word_count:
-            longest_url = max(page_word_count, key=page_word_count.get)
-            word_count = page_word_count[longest_url]
-        else:
-            longest_url, word_count = None, 0
+        word_count, longest_url = stats.longest
             
         f.write("longest page:\n")
         f.write(f"URL: {longest_url}\n")
         f.write(f"word count: {word_count}\n\n")
 
         f.write("50 most common words:\n")
-        for word, count in total_word_count.most_common(50):
+        for word, count in stats.words.most_common(50):
             f.write(f"{word}: {count}\n")
         f.write("\n")
 
         f.write("subdomains:\n")
-        for subdomain, count in sorted(subdomain_unique_pages.items()):
+        for subdomain, count in sorted(stats.subdomains.items()):
             f.write(f"{subdomain}, {count}\n")
 
+        if trapped:
+            f.write("\ntrapped path patterns:\n")
+            for pattern, count in trapped:
+                f.write(f"{pattern}, {count}\n")
+
+        near_duplicates = stats.near_duplicates
+        checked = near_duplicates.hits + near_duplicates.misses
+        f.write("\nnear duplicates:\n")
+        f.write(f"hits: {near_duplicates.hits}\n")
+        f.write(f"misses: {near_duplicates.misses}\n")
+        f.write(f"hit rate: "
+                f"{near_duplicates.hits / checked if checked else 0:.2%}\n")
+
         f.write("\nEnd of report\n")
+    os.replace("report.txt.tmp", "report.txt")
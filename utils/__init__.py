@@ -3,22 +3,19 @@ import logging
 from hashlib import sha256
 from urllib.parse import urlparse
 
+from utils.log_queue import LOG_DIR, log_queue
+
 def get_logger(name, filename=None):
+    """
+    A logger writing to Logs/<filename or name>.log and the console through
+    utils.log_queue. Asking for the same logger again adds no handlers.
+    """
     logger = logging.getLogger(name)
     logger.setLevel(logging.INFO)
-    if not os.path.exists("Logs"):
-        os.makedirs("Logs")
-    fh = logging.FileHandler(f"Logs/{filename if filename else name}.log")
-    fh.setLevel(logging.DEBUG)
-    ch = logging.StreamHandler()
-    ch.setLevel(logging.INFO)
-    formatter = logging.Formatter(
-       "%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-    fh.setFormatter(formatter)
-    ch.setFormatter(formatter)
-    # add the handlers to the logger
-    logger.addHandler(fh)
-    logger.addHandler(ch)
+    handler = log_queue.handler(
+        name, os.path.join(LOG_DIR, f"{filename if filename else name}.log"))
+    if handler not in logger.handlers:
+        logger.addHandler(handler)
     return logger
 
 
@@ -0,0 +1,154 @@
+import mmap
+import os
+import struct
+import zlib
+from threading import Lock
+
+import cbor
+
+from utils.fingerprint import url_fingerprint
+from utils.response import Response
+
+SEGMENT_SIZE = 256 * 2 ** 20
+# url fingerprint, segment number, offset and length of the record.
+INDEX_ENTRY = struct.Struct("<8sIQI")
+RECORD_HEADER = struct.Struct("<I")
+
+
+class ArchivedContent(object):
+    """Stands in for the pickled raw response of the cache server."""
+    def __init__(self, url, content, headers=None):
+        self.url = url
+        self.content = content
+        self.headers = headers if headers is not None else dict()
+
+
+def _headers(raw):
+    # The response headers of the page, such as its Content-Type.
+    headers = getattr(raw, "headers", None)
+    if not headers:
+        return None
+    return {str(name): str(value) for name, value in headers.items()}
+
+
+def _segment_name(path, number):
+    return os.path.join(path, f"segment-{number:05d}.dat")
+
+
+class ResponseRecorder(object):
+    """
+    Appends every downloaded response to a directory of segment files.
+
+    Each record is a 4 byte length followed by a zlib compressed cbor map of
+    url, status, error, content and headers. Segments roll over at
+    SEGMENT_SIZE bytes. After a record is written its location is appended
+    to "index", so an entry never points past the data. Entries are keyed on
+    the requested url, which the cache server may report differently. Every recorder writes segments
+    of its own, created exclusively, and index entries are single appends,
+    so several processes can record into one archive.
+    """
+    replay = False
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.lock = Lock()
+        self.segment = -1
+        self.data = self._new_segment()
+        self.index = open(os.path.join(path, "index"), "ab")
+
+    def _new_segment(self):
+        while True:
+            self.segment += 1
+            try:
+                return open(_segment_name(self.path, self.segment), "xb")
+            except FileExistsError:
+                continue
+
+    def put(self, url, resp):
+        """Record the Response downloaded for `url`."""
+        raw = resp.raw_response
+        blob = zlib.compress(cbor.dumps({
+            "url": resp.url,
+            "status": resp.status,
+            "error": resp.error,
+            "content": raw.content if raw is not None else None,
+            "headers": _headers(raw) if raw is not None else None}))
+        record = RECORD_HEADER.pack(len(blob)) + blob
+        with self.lock:
+            if self.data.tell() + len(record) > SEGMENT_SIZE:
+                self.data.close()
+                self.data = self._new_segment()
+            offset = self.data.tell()
+            self.data.write(record)
+            self.data.flush()
+            self.index.write(INDEX_ENTRY.pack(
+                url_fingerprint(url), self.segment, offset,
+                len(record)))
+            self.index.flush()
+
+    def close(self):
+        with self.lock:
+            self.data.close()
+            self.index.close()
+
+
+class ResponseReplayer(object):
+    """
+    Serves responses recorded by ResponseRecorder. The index is read into
+    memory (the last record of a url wins) and segments are mmapped, so a
+    lookup is one dict access, a slice and a decompression.
+    """
+    replay = True
+
+    def __init__(self, path):
+        self.path = path
+        self.locations = dict()
+        self.segments = dict()
+        with open(os.path.join(path, "index"), "rb") as f:
+            index = f.read()
+        # A crash while appending may leave a partial last entry.
+        end = len(index) - len(index) % INDEX_ENTRY.size
+        for fingerprint, segment, offset, length in INDEX_ENTRY.iter_unpack(
+                index[:end]):
+            self.locations[fingerprint] = (segment, offset, length)
+
+    def __len__(self):
+        return len(self.locations)
+
+    def _segment(self, number):
+        segment = self.segments.get(number)
+        if segment is None:
+            with open(_segment_name(self.path, number), "rb") as f:
+                segment = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.segments[number] = segment
+        return segment
+
+    def get(self, url, logger=None):
+        """The recorded Response of `url`, or a 600 error if it has none."""
+        location = self.locations.get(url_fingerprint(url))
+        if location is None:
+            if logger:
+                logger.error(f"No recorded response for {url}.")
+            return Response({
+                "error": f"No recorded response for {url}.",
+                "status": 600,
+                "url": url})
+        segment, offset, length = location
+        record = self._segment(segment)[
+            offset + RECORD_HEADER.size:offset + length]
+        fields = cbor.loads(zlib.decompress(record))
+        resp = Response({
+            "url": fields["url"],
+            "status": fields["status"],
+            "error": fields["error"]})
+        if fields["content"] is not None:
+            # Archives recorded before headers were kept have none.
+            resp.raw_response = ArchivedContent(
+                fields["url"], fields["content"], fields.get("headers"))
+        return resp
+
+    def close(self):
+        for segment in self.segments.values():
+            segment.close()
+        self.segments.clear()
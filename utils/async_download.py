@@ -0,0 +1,112 @@
+import asyncio
+from urllib.parse import urlencode
+
+from utils.download import decode_response
+
+
+class _Connection(object):
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    def close(self):
+        self.writer.close()
+
+
+class AsyncDownloader(object):
+    """
+    asyncio counterpart of utils.download.download. Keeps a pool of
+    keep-alive HTTP/1.1 connections to the cache server, allows at most
+    `config.max_inflight` requests at once, and retries requests that time
+    out or lose their connection.
+    """
+    def __init__(self, config, logger=None):
+        self.config = config
+        self.logger = logger
+        # No cache server when replaying an archive.
+        self.host, self.port = config.cache_server or (None, None)
+        self.inflight = asyncio.Semaphore(config.max_inflight)
+        self.idle = list()  # connections ready for reuse
+
+    async def _connect(self):
+        if self.idle:
+            return self.idle.pop()
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        return _Connection(reader, writer)
+
+    async def _request(self, conn, url):
+        query = urlencode([("q", url), ("u", self.config.user_agent)])
+        conn.writer.write(
+            f"GET /?{query} HTTP/1.1\r\n"
+            f"Host: {self.host}:{self.port}\r\n"
+            f"Connection: keep-alive\r\n\r\n".encode("latin-1"))
+        await conn.writer.drain()
+
+        status_line = await conn.reader.readline()
+        if not status_line:
+            raise ConnectionResetError("Cache server closed the connection.")
+        status_code = int(status_line.split()[1])
+        headers = dict()
+        while True:
+            line = await conn.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        reusable = headers.get("connection", "").lower() != "close"
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = list()
+            while True:
+                size = int((await conn.reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    await conn.reader.readline()
+                    break
+                chunks.append(await conn.reader.readexactly(size))
+                await conn.reader.readline()
+            content = b"".join(chunks)
+        elif "content-length" in headers:
+            content = await conn.reader.readexactly(
+                int(headers["content-length"]))
+        else:
+            content = await conn.reader.read()
+            reusable = False
+        return status_code, content, reusable
+
+    async def download(self, url):
+        archive = self.config.archive
+        if archive is not None and archive.replay:
+            return archive.get(url, self.logger)
+        resp = await self._download(url)
+        if archive is not None:
+            archive.put(url, resp)
+        return resp
+
+    async def _download(self, url):
+        async with self.inflight:
+            for attempt in range(self.config.fetch_retries + 1):
+                conn = await self._connect()
+                try:
+                    status_code, content, reusable = await asyncio.wait_for(
+                        self._request(conn, url), self.config.fetch_timeout)
+                except (OSError, asyncio.TimeoutError,
+                        asyncio.IncompleteReadError, ValueError) as e:
+                    conn.close()
+                    if attempt == self.config.fetch_retries:
+                        if self.logger:
+                            self.logger.error(
+                                f"Failed to download {url} after "
+                                f"{attempt + 1} attempts: {e!r}")
+                        return decode_response(url, 600, None, self.logger)
+                    await asyncio.sleep(0.5 * 2 ** attempt)
+                    continue
+                if reusable:
+                    self.idle.append(conn)
+                else:
+                    conn.close()
+                return decode_response(
+                    url, status_code, content, self.logger)
+
+    def close(self):
+        while self.idle:
+            self.idle.pop().close()
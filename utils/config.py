@@ -8,12 +8,78 @@ class Config(object):
         assert self.user_agent != "DEFAULT AGENT", "Set useragent in config.ini"
         assert re.match(r"^[a-zA-Z0-9_ ,]+$", self.user_agent), "User agent should not have any special characters outside '_', ',' and 'space'"
         self.threads_count = int(config["LOCAL PROPERTIES"]["THREADCOUNT"])
+        self.fetch_mode = config["LOCAL PROPERTIES"].get(
+            "FETCHMODE", "threads").strip()
+        assert self.fetch_mode in {"threads", "async"}, \
+            "FETCHMODE should be one of threads, async"
+        self.max_inflight = int(
+            config["LOCAL PROPERTIES"].get("MAXINFLIGHT", "64"))
+        self.parse_processes = int(
+            config["LOCAL PROPERTIES"].get("PARSEPROCESSES", "0"))
+        self.parse_queue = int(config["LOCAL PROPERTIES"].get(
+            "PARSEQUEUE", str(max(1, 2 * self.parse_processes))))
+        self.processes = max(1, int(
+            config["LOCAL PROPERTIES"].get("PROCESSES", "1")))
+        self.shard_batch = int(
+            config["LOCAL PROPERTIES"].get("SHARDBATCH", "256"))
+        self.metrics_interval = float(
+            config["LOCAL PROPERTIES"].get("METRICSINTERVAL", "30"))
+        self.metrics_port = int(
+            config["LOCAL PROPERTIES"].get("METRICSPORT", "0"))
+        self.metrics_sample = max(1, int(
+            config["LOCAL PROPERTIES"].get("METRICSSAMPLE", "16")))
+        self.log_url_rate = int(
+            config["LOCAL PROPERTIES"].get("LOGURLRATE", "20"))
+        self.crawl_log = config["LOCAL PROPERTIES"].get(
+            "CRAWLLOG", "Logs/crawl.jsonl").strip()
+        self.profile = config["LOCAL PROPERTIES"].getboolean(
+            "PROFILE", False)
+        self.profile_interval = float(
+            config["LOCAL PROPERTIES"].get("PROFILEINTERVAL", "10")) / 1000
+        self.profile_file = config["LOCAL PROPERTIES"].get(
+            "PROFILEFILE", "Logs/profile").strip()
         self.save_file = config["LOCAL PROPERTIES"]["SAVE"]
+        self.store = config["LOCAL PROPERTIES"].get("STORE", "log").strip()
+        self.sync_records = int(
+            config["LOCAL PROPERTIES"].get("SYNCRECORDS", "256"))
+        self.sync_interval = float(
+            config["LOCAL PROPERTIES"].get("SYNCINTERVAL", "500")) / 1000
+        self.durability = config["LOCAL PROPERTIES"].get(
+            "DURABILITY", "batch").strip()
+        assert self.durability in {"none", "batch", "always"}, \
+            "DURABILITY should be one of none, batch, always"
 
         self.host = config["CONNECTION"]["HOST"]
         self.port = int(config["CONNECTION"]["PORT"])
+        self.fetch_timeout = float(config["CONNECTION"].get("TIMEOUT", "30"))
+        self.fetch_retries = int(config["CONNECTION"].get("RETRIES", "2"))
 
         self.seed_urls = config["CRAWLER"]["SEEDURL"].split(",")
         self.time_delay = float(config["CRAWLER"]["POLITENESS"])
+        self.priority = config["CRAWLER"].get("PRIORITY", "priority").strip()
+        assert self.priority in {"priority", "fifo"}, \
+            "PRIORITY should be one of priority, fifo"
+        self.trap_limit = int(config["CRAWLER"].get("TRAPLIMIT", "30"))
+        self.trap_save_interval = float(
+            config["CRAWLER"].get("TRAPSAVEINTERVAL", "60"))
+        self.near_duplicate_distance = int(
+            config["CRAWLER"].get("NEARDUPDISTANCE", "3"))
+        self.near_duplicate_capacity = int(
+            config["CRAWLER"].get("NEARDUPCAPACITY", "1000000"))
+        self.stats_snapshot_pages = int(
+            config["CRAWLER"].get("STATSSNAPSHOT", "500"))
+        self.top_words_capacity = int(
+            config["CRAWLER"].get("TOPWORDS", "10000"))
+        self.max_page_bytes = int(
+            config["CRAWLER"].get("MAXPAGEBYTES", str(2 * 2 ** 20)))
+        self.min_text_ratio = float(
+            config["CRAWLER"].get("MINTEXTRATIO", "0.02"))
+        self.robots = config["CRAWLER"].getboolean("ROBOTS", True)
+        self.robots_ttl = float(config["CRAWLER"].get("ROBOTSTTL", "86400"))
+        # Optional replacements for the url rules in scraper.py.
+        self.filter_rules = (
+            config["FILTER"] if config.has_section("FILTER") else dict())
 
-        self.cache_server = None
\ No newline at end of file
+        self.cache_server = None
+        # utils.archive recorder or replayer, set by launch.py.
+        self.archive = None
\ No newline at end of file
@@ -1,21 +1,49 @@
-import requests
 import cbor
 import time
+import threading
 
+from utils.metrics import metrics
 from utils.response import Response
 
-def download(url, config, logger=None):
-    host, port = config.cache_server
-    resp = requests.get(
-        f"http://{host}:{port}/",
-        params=[("q", f"{url}"), ("u", f"{config.user_agent}")])
+# One keep-alive session per thread so fetches reuse their connection to the
+# cache server instead of opening a new one each time.
+_local = threading.local()
+
+def _session():
+    if not hasattr(_local, "session"):
+        # requests is slow to import and unused when replaying an archive.
+        import requests
+        _local.session = requests.Session()
+    return _local.session
+
+def decode_response(url, status_code, content, logger=None):
+    """Turn a cache server reply into a Response."""
+    if content:
+        metrics.count("bytes", len(content))
     try:
-        if resp and resp.content:
-            return Response(cbor.loads(resp.content))
+        if status_code < 400 and content:
+            return Response(cbor.loads(content))
     except (EOFError, ValueError) as e:
         pass
-    logger.error(f"Spacetime Response error {resp} with url {url}.")
+    if logger:
+        logger.error(
+            f"Spacetime Response error <{status_code}> with url {url}.")
     return Response({
-        "error": f"Spacetime Response error {resp} with url {url}.",
-        "status": resp.status_code,
+        "error": f"Spacetime Response error <{status_code}> with url {url}.",
+        "status": status_code,
         "url": url})
+
+def download(url, config, logger=None):
+    # With --replay, responses come from a utils.archive directory instead.
+    archive = config.archive
+    if archive is not None and archive.replay:
+        return archive.get(url, logger)
+    host, port = config.cache_server
+    resp = _session().get(
+        f"http://{host}:{port}/",
+        params=[("q", f"{url}"), ("u", f"{config.user_agent}")],
+        timeout=config.fetch_timeout)
+    resp = decode_response(url, resp.status_code, resp.content, logger)
+    if archive is not None:
+        archive.put(url, resp)
+    return resp
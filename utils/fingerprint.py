@@ -0,0 +1,132 @@
+import struct
+from array import array
+from hashlib import blake2b
+from urllib.parse import urlparse
+
+DIGEST_SIZE = 8
+
+
+def url_fingerprint(url, size=DIGEST_SIZE):
+    """
+    Compact binary identity of a url: a truncated blake2b over the same
+    components get_urlhash uses (everything other than the scheme).
+    """
+    parsed = urlparse(url)
+    return blake2b(
+        f"{parsed.netloc}/{parsed.path}/{parsed.params}/"
+        f"{parsed.query}/{parsed.fragment}".encode("utf-8"),
+        digest_size=size).digest()
+
+
+def content_fingerprint(content, size=DIGEST_SIZE):
+    return blake2b(content, digest_size=size).digest()
+
+
+class FingerprintSet(object):
+    """
+    Open-addressing hash set of 8 or 16 byte fingerprints stored in a flat
+    array of unsigned 64-bit words, with linear probing. An all-zero slot
+    marks an empty bucket, so a zero fingerprint is stored with its lowest
+    bit set. Not thread safe.
+    """
+    MAX_LOAD = 0.6
+
+    def __init__(self, size=DIGEST_SIZE, capacity=1024):
+        assert size in (8, 16), "Fingerprints must be 8 or 16 bytes"
+        self.words = size // 8
+        self.count = 0
+        self._allocate(max(16, 1 << (capacity - 1).bit_length()))
+
+    def _allocate(self, capacity):
+        self.capacity = capacity
+        self.mask = capacity - 1
+        self.table = array("Q", bytes(8 * self.words * capacity))
+
+    def _key(self, fingerprint):
+        high = (int.from_bytes(fingerprint[8:16], "little")
+                if self.words == 2 else 0)
+        low = int.from_bytes(fingerprint[:8], "little")
+        if not low and not high:
+            low = 1
+        return low, high
+
+    def _find(self, low, high):
+        """Slot holding the key, or the empty slot where it would go."""
+        table, words, mask = self.table, self.words, self.mask
+        slot = low & mask
+        while True:
+            start = slot * words
+            head = table[start]
+            tail = table[start + 1] if words == 2 else 0
+            if head == low and tail == high:
+                return slot, True
+            if not head and not tail:
+                return slot, False
+            slot = (slot + 1) & mask
+
+    def _store(self, slot, low, high):
+        start = slot * self.words
+        self.table[start] = low
+        if self.words == 2:
+            self.table[start + 1] = high
+
+    def __contains__(self, fingerprint):
+        return self._find(*self._key(fingerprint))[1]
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        table, words = self.table, self.words
+        for start in range(0, len(table), words):
+            low = table[start]
+            high = table[start + 1] if words == 2 else 0
+            if low or high:
+                yield (low.to_bytes(8, "little")
+                       + (high.to_bytes(8, "little") if words == 2 else b""))
+
+    def add(self, fingerprint):
+        """Add a fingerprint, returning True if it was not present."""
+        low, high = self._key(fingerprint)
+        slot, found = self._find(low, high)
+        if found:
+            return False
+        self._store(slot, low, high)
+        self.count += 1
+        if self.count > self.capacity * self.MAX_LOAD:
+            self._grow()
+        return True
+
+    def update(self, fingerprints):
+        for fingerprint in fingerprints:
+            self.add(fingerprint)
+
+    def _grow(self):
+        old, words = self.table, self.words
+        self._allocate(self.capacity * 2)
+        for start in range(0, len(old), words):
+            low = old[start]
+            high = old[start + 1] if words == 2 else 0
+            if low or high:
+                self._store(self._find(low, high)[0], low, high)
+
+    @property
+    def nbytes(self):
+        return self.table.itemsize * len(self.table)
+
+    def dump(self, f):
+        """Write the set to a binary file object."""
+        f.write(struct.pack("<QQQ", self.words, self.count, self.capacity))
+        self.table.tofile(f)
+
+    @classmethod
+    def load(cls, f):
+        """Read a set written by dump."""
+        words, count, capacity = struct.unpack("<QQQ", f.read(24))
+        fingerprints = cls(size=8 * words)
+        fingerprints.capacity = capacity
+        fingerprints.mask = capacity - 1
+        fingerprints.table = array("Q")
+        fingerprints.table.fromfile(f, words * capacity)
+        fingerprints.count = count
+        return fingerprints
@@ -0,0 +1,54 @@
+import re
+from html.parser import HTMLParser
+
+WORD_RE = re.compile(r"\b\w+\b")
+
+
+class PageScanner(HTMLParser):
+    """
+    Single streaming pass over a page that collects anchor hrefs and the
+    words of its visible text, without building a tree. Text inside script
+    and style elements and comments is skipped, as it was when both were
+    taken from BeautifulSoup.
+    """
+    SKIPPED = {"script", "style"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.hrefs = list()
+        self.words = list()
+        self.skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "a":
+            for name, value in attrs:
+                if name == "href":
+                    self.hrefs.append(value or "")
+                    break
+        elif tag in self.SKIPPED:
+            self.skip_depth += 1
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIPPED and self.skip_depth:
+            self.skip_depth -= 1
+
+    def handle_data(self, data):
+        if not self.skip_depth:
+            self.words.extend(WORD_RE.findall(data))
+
+
+def decode(content):
+    if isinstance(content, str):
+        return content
+    try:
+        return content.decode("utf-8")
+    except UnicodeDecodeError:
+        return content.decode("cp1252", errors="replace")
+
+
+def scan(content):
+    """Returns (hrefs, words) of an html page given as bytes or str."""
+    scanner = PageScanner()
+    scanner.feed(decode(content))
+    scanner.close()
+    return scanner.hrefs, scanner.words
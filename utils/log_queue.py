@@ -0,0 +1,248 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_DIR = "Logs"
+FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+# Buffered lines are written once the queue is empty or this many are
+# waiting, whichever comes first.
+BATCH_LINES = 512
+
+
+class _BatchedFile(logging.Handler):
+    """
+    Collects formatted lines and appends them with one write per batch.
+    The file is unbuffered and opened for appending, so each batch lands
+    whole even when several crawl processes share the file.
+    """
+    def __init__(self, filename, formatter):
+        super().__init__(logging.DEBUG)
+        self.setFormatter(formatter)
+        self.filename = filename
+        self.lines = list()
+        self.file = None
+
+    def emit(self, record):
+        try:
+            self.lines.append(self.format(record) + "\n")
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        if not self.lines:
+            return
+        data = "".join(self.lines).encode("utf-8")
+        self.lines = list()
+        if self.file is None:
+            directory = os.path.dirname(self.filename)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.file = open(self.filename, "ab", buffering=0)
+        self.file.write(data)
+
+    def close(self):
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+        super().close()
+
+
+class _BatchedConsole(_BatchedFile):
+    def __init__(self, formatter):
+        super().__init__(None, formatter)
+        self.setLevel(logging.INFO)
+
+    def flush(self):
+        if self.lines:
+            sys.stderr.write("".join(self.lines))
+            sys.stderr.flush()
+            self.lines = list()
+
+    def close(self):
+        self.flush()
+        logging.Handler.close(self)
+
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record):
+        return json.dumps(record.event, separators=(",", ":"))
+
+
+class _Router(logging.Handler):
+    """
+    Hands every record to the file of the handler it came through, and to
+    the console unless it is a crawl log event. Only the listener thread
+    calls it, so the batches need no locking.
+    """
+    def __init__(self):
+        super().__init__()
+        self.formatter = logging.Formatter(FORMAT)
+        self.json_formatter = _JsonFormatter()
+        self.console = _BatchedConsole(self.formatter)
+        self.files = dict()  # file name -> _BatchedFile
+        self.pending = 0
+
+    def _file(self, filename, formatter):
+        handler = self.files.get(filename)
+        if handler is None:
+            handler = self.files[filename] = _BatchedFile(filename, formatter)
+        return handler
+
+    def handle(self, record):
+        if hasattr(record, "event"):
+            self._file(record.logfile, self.json_formatter).handle(record)
+        else:
+            self._file(record.logfile, self.formatter).handle(record)
+            self.console.handle(record)
+        self.pending += 1
+
+    def flush(self):
+        for handler in self.files.values():
+            handler.flush()
+        self.console.flush()
+        self.pending = 0
+
+    def drop(self):
+        """Forget buffered lines, which the parent of a fork will write."""
+        for handler in self.files.values():
+            handler.lines = list()
+        self.console.lines = list()
+        self.pending = 0
+
+    def close(self):
+        for handler in self.files.values():
+            handler.close()
+        self.console.close()
+        super().close()
+
+
+class _Listener(QueueListener):
+    def handle(self, record):
+        super().handle(record)
+        router = self.handlers[0]
+        if router.pending >= BATCH_LINES or self.queue.empty():
+            router.flush()
+
+
+class _LogFile(QueueHandler):
+    """Puts records on the log queue, tagged with the file they go to."""
+    def __init__(self, log_queue, filename):
+        super().__init__(log_queue)
+        self.filename = filename
+
+    def prepare(self, record):
+        record = super().prepare(record)
+        record.logfile = self.filename
+        return record
+
+
+class UrlRateLimit(logging.Filter):
+    """
+    Lets through at most `rate` records per second and thread among those
+    logged with an extra "url" below WARNING, the per url lines of the
+    workers. The next line let through says how many were dropped. A
+    rate of 0 lets everything through.
+    """
+    def __init__(self, rate=0):
+        super().__init__()
+        self.rate = rate
+        self.local = threading.local()
+
+    def filter(self, record):
+        if (not self.rate or record.levelno >= logging.WARNING
+                or not hasattr(record, "url")):
+            return True
+        local = self.local
+        second = int(time.time())
+        if getattr(local, "second", None) != second:
+            local.second = second
+            local.count = 0
+            local.dropped = getattr(local, "dropped", 0)
+        local.count += 1
+        if local.count > self.rate:
+            local.dropped += 1
+            return False
+        if local.dropped:
+            record.msg = (
+                f"{record.msg} ({local.dropped} similar lines dropped)")
+            local.dropped = 0
+        return True
+
+
+class LogQueue(object):
+    """
+    Logging backend of the crawler. Loggers put records on one queue; a
+    QueueListener thread formats them and writes them in batches to the
+    log files and the console, so threads logging on the hot path only pay
+    for a queue put. Each logger has a queue handler of its own, so worker
+    threads do not contend for one handler lock. Crawl log events take the
+    same path into a JSON lines file.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queue = queue.SimpleQueue()
+        self.router = _Router()
+        self.handlers = dict()  # logger name -> _LogFile
+        self.rate_limit = UrlRateLimit()
+        self.crawl_log = None
+        self.listener = None
+        os.register_at_fork(after_in_child=self._after_fork)
+        atexit.register(self.stop)
+
+    def handler(self, name, filename):
+        """The queue handler of logger `name`, writing to `filename`."""
+        with self.lock:
+            handler = self.handlers.get(name)
+            if handler is None:
+                handler = self.handlers[name] = _LogFile(
+                    self.queue, filename)
+                handler.addFilter(self.rate_limit)
+            if self.listener is None:
+                self._start()
+            return handler
+
+    def configure(self, config):
+        self.rate_limit.rate = config.log_url_rate
+        self.crawl_log = config.crawl_log or None
+
+    def _start(self):
+        self.listener = _Listener(self.queue, self.router)
+        self.listener.start()
+
+    def event(self, fields):
+        """Append `fields` to the crawl log as one JSON line, if enabled."""
+        if self.crawl_log is None:
+            return
+        record = logging.makeLogRecord({
+            "name": "crawl", "levelno": logging.INFO, "levelname": "INFO",
+            "event": fields, "logfile": self.crawl_log})
+        self.queue.put_nowait(record)
+
+    def _after_fork(self):
+        # The listener thread does not survive a fork. The child gets a
+        # queue and listener of its own and leaves buffered lines to the
+        # parent; the files are shared, opened for appending.
+        self.lock = threading.Lock()
+        self.queue = queue.SimpleQueue()
+        for handler in self.handlers.values():
+            handler.queue = self.queue
+        self.router.drop()
+        if self.listener is not None:
+            self._start()
+
+    def stop(self):
+        """Write everything still queued."""
+        with self.lock:
+            if self.listener is not None:
+                self.listener.stop()
+                self.listener = None
+            self.router.flush()
+
+
+log_queue = LogQueue()
@@ -0,0 +1,314 @@
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Histogram bucket i counts durations in (2 ** (MIN_EXP + i - 1),
+# 2 ** (MIN_EXP + i)] seconds: from about a microsecond to a minute.
+MIN_EXP = -20
+MAX_EXP = 6
+BUCKETS = MAX_EXP - MIN_EXP + 1
+
+# Label names of labelled counters, in the order of their label values.
+LABELS = {"responses": ("host", "status"), "skipped": ("reason",)}
+
+
+class _Shard(object):
+    """
+    Counters and histograms written by a single thread, so updates need no
+    lock. Readers copy the dicts, which is atomic under the GIL, and may see
+    values a few updates old.
+    """
+    def __init__(self):
+        self.counters = dict()  # (name, *label values) -> total
+        self.histograms = dict()  # name -> [bucket counts..., sum]
+        self.calls = dict()  # name -> calls, for sampling
+
+
+class _Timer(object):
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+
+
+class _TimedLock(object):
+    """A lock whose acquire time is observed for a sample of acquisitions."""
+    def __init__(self, metrics, lock, name):
+        self.metrics = metrics
+        self.lock = lock
+        self.name = name
+
+    def __enter__(self):
+        if self.metrics.sampled(self.name):
+            start = time.perf_counter()
+            self.lock.acquire()
+            self.metrics.observe(self.name, time.perf_counter() - start)
+        else:
+            self.lock.acquire()
+        return self.lock
+
+    def __exit__(self, *exc_info):
+        self.lock.release()
+
+
+class Metrics(object):
+    """
+    Crawl counters, timing histograms and gauges.
+
+    Every thread updates its own shard; reads merge the shards. Timings of
+    very frequent operations (is_valid, frontier lock waits) are taken for
+    one call in `sample_every` through sampled(name), so instrumentation can
+    stay on during a real crawl.
+    """
+    def __init__(self, sample_every=16):
+        self.sample_every = sample_every
+        self.local = threading.local()
+        self.shards = list()
+        self.shards_lock = threading.Lock()
+        self.gauges = dict()  # name -> function returning the current value
+        self.started = time.time()
+        self.last_rates = (self.started, 0, 0)
+
+    def _shard(self):
+        shard = getattr(self.local, "shard", None)
+        if shard is None:
+            shard = self.local.shard = _Shard()
+            with self.shards_lock:
+                self.shards.append(shard)
+        return shard
+
+    def count(self, name, value=1, labels=()):
+        counters = self._shard().counters
+        key = (name, *labels)
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name, seconds):
+        histograms = self._shard().histograms
+        histogram = histograms.get(name)
+        if histogram is None:
+            histogram = histograms[name] = [0] * (BUCKETS + 1)
+        exponent = math.frexp(seconds)[1] if seconds > 0 else MIN_EXP
+        histogram[min(max(exponent, MIN_EXP), MAX_EXP) - MIN_EXP] += 1
+        histogram[BUCKETS] += seconds
+
+    def timer(self, name):
+        """Context manager observing the time spent in its block."""
+        return _Timer(self, name)
+
+    def timed_lock(self, lock, name):
+        """Wrap `lock` so `with` blocks observe a sample of acquire times."""
+        return _TimedLock(self, lock, name)
+
+    def sampled(self, name):
+        """True for one call to `name` in `sample_every` on this thread."""
+        calls = self._shard().calls
+        calls[name] = count = calls.get(name, 0) + 1
+        return count % self.sample_every == 0
+
+    def gauge(self, name, function):
+        self.gauges[name] = function
+
+    def counters(self):
+        totals = dict()
+        with self.shards_lock:
+            shards = list(self.shards)
+        for shard in shards:
+            for key, value in dict(shard.counters).items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def histograms(self):
+        merged = dict()
+        with self.shards_lock:
+            shards = list(self.shards)
+        for shard in shards:
+            for name, histogram in dict(shard.histograms).items():
+                total = merged.setdefault(name, [0] * (BUCKETS + 1))
+                for i, value in enumerate(list(histogram)):
+                    total[i] += value
+        return merged
+
+    def gauge_values(self):
+        values = dict()
+        for name, function in list(self.gauges.items()):
+            try:
+                values[name] = function()
+            except Exception:
+                continue
+        return values
+
+    def rates(self, counters):
+        """Pages and bytes per second since the previous call."""
+        now = time.time()
+        pages = counters.get(("pages",), 0)
+        downloaded = counters.get(("bytes",), 0)
+        last_time, last_pages, last_bytes = self.last_rates
+        self.last_rates = (now, pages, downloaded)
+        elapsed = max(now - last_time, 1e-9)
+        return ((pages - last_pages) / elapsed,
+                (downloaded - last_bytes) / elapsed)
+
+    def summary(self):
+        """One line with rates, gauges and p50/p99 of every histogram."""
+        counters = self.counters()
+        pages_rate, bytes_rate = self.rates(counters)
+        parts = [
+            f"pages={counters.get(('pages',), 0)} ({pages_rate:.1f}/s)",
+            f"bytes={_size(counters.get(('bytes',), 0))} "
+            f"({_size(bytes_rate)}/s)"]
+        for name, value in sorted(self.gauge_values().items()):
+            parts.append(f"{name}={value}")
+        statuses = dict()
+        skipped = dict()
+        for key, value in counters.items():
+            if key[0] == "responses":
+                statuses[key[2]] = statuses.get(key[2], 0) + value
+            elif key[0] == "skipped":
+                skipped[key[1]] = value
+        if statuses:
+            parts.append("status=" + ",".join(
+                f"{status}:{value}" for status, value in sorted(
+                    statuses.items(), key=lambda item: str(item[0]))))
+        if skipped:
+            parts.append("skipped=" + ",".join(
+                f"{reason}:{value}" for reason, value in sorted(
+                    skipped.items())))
+        for name, histogram in sorted(self.histograms().items()):
+            count = sum(histogram[:BUCKETS])
+            if count:
+                average = histogram[BUCKETS] / count
+                parts.append(
+                    f"{name}(n={count} avg={_duration(average)} "
+                    f"p50={_duration(quantile(histogram, 0.5))} "
+                    f"p99={_duration(quantile(histogram, 0.99))})")
+        return " ".join(parts)
+
+    def exposition(self):
+        """All metrics in the Prometheus text format."""
+        lines = list()
+        counters = self.counters()
+        for key, value in sorted(counters.items(), key=str):
+            name, values = key[0], key[1:]
+            labels = ",".join(
+                f'{label}="{label_value}"'
+                for label, label_value in zip(LABELS.get(name, ()), values))
+            lines.append(
+                f"crawler_{name}_total{{{labels}}} {value}" if labels
+                else f"crawler_{name}_total {value}")
+        elapsed = max(time.time() - self.started, 1e-9)
+        lines.append(f"crawler_pages_per_second "
+                     f"{counters.get(('pages',), 0) / elapsed:.3f}")
+        lines.append(f"crawler_bytes_per_second "
+                     f"{counters.get(('bytes',), 0) / elapsed:.3f}")
+        for name, value in sorted(self.gauge_values().items()):
+            lines.append(f"crawler_{name} {value}")
+        for name, histogram in sorted(self.histograms().items()):
+            metric = f"crawler_{name}_seconds"
+            cumulative = 0
+            for i in range(BUCKETS):
+                cumulative += histogram[i]
+                bound = 2.0 ** (MIN_EXP + i)
+                lines.append(f'{metric}_bucket{{le="{bound:g}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{le="+Inf"}} {cumulative}')
+            lines.append(f"{metric}_sum {histogram[BUCKETS]:.6f}")
+            lines.append(f"{metric}_count {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+def quantile(histogram, q):
+    """Upper bound of the bucket holding the q-th quantile."""
+    count = sum(histogram[:BUCKETS])
+    seen = 0
+    for i in range(BUCKETS):
+        seen += histogram[i]
+        if seen >= q * count:
+            return 2.0 ** (MIN_EXP + i)
+    return 2.0 ** MAX_EXP
+
+
+def _duration(seconds):
+    if seconds >= 1:
+        return f"{seconds:.2f}s"
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.1f}ms"
+    return f"{seconds * 1e6:.0f}us"
+
+
+def _size(count):
+    for unit in ("B", "KB", "MB"):
+        if count < 1024:
+            return f"{count:.0f}{unit}"
+        count /= 1024
+    return f"{count:.1f}GB"
+
+
+class MetricsReporter(object):
+    """
+    Logs metrics.summary() every `config.metrics_interval` seconds and, when
+    `config.metrics_port` is set, serves metrics.exposition() at
+    http://127.0.0.1:<port>/metrics. Both run on daemon threads.
+    """
+    def __init__(self, config, logger):
+        self.config = config
+        self.logger = logger
+        self.stopped = threading.Event()
+        self.thread = None
+        self.server = None
+
+    def start(self):
+        if self.config.metrics_interval > 0:
+            self.thread = threading.Thread(target=self._log_loop, daemon=True)
+            self.thread.start()
+        if self.config.metrics_port:
+            self.server = ThreadingHTTPServer(
+                ("127.0.0.1", self.config.metrics_port), _MetricsHandler)
+            self.server.daemon_threads = True
+            threading.Thread(
+                target=self.server.serve_forever, daemon=True).start()
+            self.logger.info(
+                f"Serving metrics on "
+                f"http://127.0.0.1:{self.server.server_address[1]}/metrics")
+
+    def _log_loop(self):
+        while not self.stopped.wait(self.config.metrics_interval):
+            self.logger.info(metrics.summary())
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+        if self.config.metrics_interval > 0:
+            self.logger.info(metrics.summary())
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.exposition().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Shared by every module of the crawler; Crawler sets sample_every from the
+# config.
+metrics = Metrics()
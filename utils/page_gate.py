@@ -0,0 +1,69 @@
+import re
+
+# Markup without visible text: scripts, styles, comments and tags.
+MARKUP = re.compile(
+    rb"<script\b.*?</script\s*>|<style\b.*?</style\s*>|<!--.*?-->|<[^>]*>",
+    re.DOTALL | re.IGNORECASE)
+HTML_TYPES = ("text/html", "application/xhtml+xml")
+# Leading bytes of binary formats sometimes served without a content type.
+BINARY_MAGIC = (
+    b"%PDF", b"PK\x03\x04", b"\x89PNG", b"GIF8", b"\xff\xd8\xff",
+    b"\x1f\x8b", b"\x7fELF")
+# Pages this small are cheap to parse whatever their text ratio.
+MIN_RATIO_BYTES = 4096
+
+
+def content_type(raw_response):
+    """The media type of a raw response, or None if it has no headers."""
+    headers = getattr(raw_response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("Content-Type") or headers.get("content-type")
+    if not value:
+        return None
+    return value.split(";", 1)[0].strip().lower()
+
+
+def is_binary(content):
+    head = content[:512]
+    return head.startswith(BINARY_MAGIC) or b"\x00" in head
+
+
+def text_ratio(content):
+    """Fraction of the bytes of a page that are visible text, not spaces."""
+    text = MARKUP.sub(b" ", content)
+    return len(b"".join(text.split())) / len(content)
+
+
+class PageGate(object):
+    """
+    Decides which downloaded pages are worth hashing and parsing, using
+    checks that cost far less than parsing:
+
+    - pages over MAXPAGEBYTES bytes,
+    - content types other than html, or binary content without one,
+    - pages of at least MIN_RATIO_BYTES whose visible text is less than
+      MINTEXTRATIO of their bytes,
+
+    are skipped. There is no cache of unchanged pages: a completed url is
+    never fetched again, and --restart clears the report statistics such a
+    cache would have to stay in step with.
+    """
+    def __init__(self, max_bytes=0, min_text_ratio=0.0):
+        self.max_bytes = max_bytes
+        self.min_text_ratio = min_text_ratio
+
+    def reject(self, raw_response, content):
+        """The reason to skip a page before hashing it, or None."""
+        if self.max_bytes and len(content) > self.max_bytes:
+            return "size"
+        media_type = content_type(raw_response)
+        if media_type is not None:
+            if media_type not in HTML_TYPES:
+                return "type"
+        elif is_binary(content):
+            return "type"
+        if (self.min_text_ratio and len(content) >= MIN_RATIO_BYTES
+                and text_ratio(content) < self.min_text_ratio):
+            return "text_ratio"
+        return None
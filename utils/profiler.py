@@ -0,0 +1,194 @@
+import atexit
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# Leaf functions listed in the breakdown, by samples.
+TOP_FUNCTIONS = 20
+
+
+class _Stages(object):
+    """Exclusive time per stage of one thread; only that thread writes it."""
+    def __init__(self):
+        self.current = None
+        self.since = 0.0
+        self.stack = list()
+        self.seconds = Counter()
+        self.calls = Counter()
+
+
+class _Stage(object):
+    __slots__ = ("stages", "name")
+
+    def __init__(self, stages, name):
+        self.stages = stages
+        self.name = name
+
+    def __enter__(self):
+        stages = self.stages
+        now = time.perf_counter()
+        if stages.current is not None:
+            stages.seconds[stages.current] += now - stages.since
+        stages.stack.append(stages.current)
+        stages.current = self.name
+        stages.since = now
+        stages.calls[self.name] += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        stages = self.stages
+        now = time.perf_counter()
+        stages.seconds[stages.current] += now - stages.since
+        stages.current = stages.stack.pop()
+        stages.since = now
+
+
+class _NoStage(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NO_STAGE = _NoStage()
+
+
+class Profiler(object):
+    """
+    Opt-in profiling of a crawl, turned on with PROFILE.
+
+    Workers wrap each stage of their loop in stage(name). A nested stage
+    pauses the one around it, so the time of each stage is its own and the
+    stages of a thread add up to its busy time. With PROFILEINTERVAL above 0
+    a sampling thread also records the stack of every other thread that
+    often, rooted at the stage it is in. Samples are wall clock, so a worker
+    waiting on the cache server counts as much as one parsing.
+
+    stop() writes "<PROFILEFILE>.collapsed", one "frame;frame;... count"
+    line per stack for flamegraph.pl or speedscope, and
+    "<PROFILEFILE>.txt" with the time per stage and the functions most
+    often on top of the stack. While off, stage() returns a shared no-op.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.local = threading.local()
+        self.threads = dict()  # thread ident -> _Stages
+        self.lock = threading.Lock()
+        self.samples = Counter()  # collapsed stack -> samples
+        self.labels = dict()  # code object -> frame label
+        self.stopped = threading.Event()
+        self.sampler = None
+        self.interval = 0
+        self.profile_file = None
+        self.started = 0.0
+        atexit.register(self.stop)
+
+    def start(self, config):
+        if not config.profile:
+            return
+        self.enabled = True
+        self.interval = config.profile_interval
+        self.profile_file = config.profile_file
+        self.local = threading.local()
+        self.threads = dict()
+        self.samples = Counter()
+        self.stopped.clear()
+        self.started = time.perf_counter()
+        if self.interval > 0:
+            self.sampler = threading.Thread(
+                target=self._sample_loop, name="Profiler", daemon=True)
+            self.sampler.start()
+
+    def stage(self, name):
+        """Context manager timing its block as stage `name`."""
+        if not self.enabled:
+            return _NO_STAGE
+        stages = getattr(self.local, "stages", None)
+        if stages is None:
+            stages = self.local.stages = _Stages()
+            with self.lock:
+                self.threads[threading.get_ident()] = stages
+        return _Stage(stages, name)
+
+    def _label(self, code):
+        label = self.labels.get(code)
+        if label is None:
+            label = self.labels[code] = (
+                f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        return label
+
+    def _sample_loop(self):
+        me = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            with self.lock:
+                threads = dict(self.threads)
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                frames = list()
+                while frame is not None:
+                    frames.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                stages = threads.get(ident)
+                if stages is not None and stages.current is not None:
+                    frames.append(f"[{stages.current}]")
+                frames.reverse()
+                self.samples[";".join(frames)] += 1
+
+    def stop(self, logger=None):
+        """Write the profile files, if profiling is on, and turn it off."""
+        if not self.enabled:
+            return
+        self.enabled = False
+        self.stopped.set()
+        if self.sampler is not None:
+            self.sampler.join()
+            self.sampler = None
+        report = self.breakdown()
+        directory = os.path.dirname(self.profile_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(f"{self.profile_file}.txt", "w", encoding="utf-8") as f:
+            f.write(report + "\n")
+        if self.samples:
+            with open(f"{self.profile_file}.collapsed", "w",
+                      encoding="utf-8") as f:
+                for stack, count in sorted(self.samples.items()):
+                    f.write(f"{stack} {count}\n")
+        if logger is not None:
+            logger.info(report)
+
+    def breakdown(self):
+        """The time per stage over every thread, and the top functions."""
+        seconds, calls = Counter(), Counter()
+        with self.lock:
+            threads = list(self.threads.values())
+        for stages in threads:
+            # Copies, as the threads may still be running.
+            seconds.update(dict(stages.seconds))
+            calls.update(dict(stages.calls))
+        busy = sum(seconds.values()) or 1e-9
+        elapsed = time.perf_counter() - self.started
+        lines = [
+            f"Profile of {elapsed:.1f}s over {len(threads)} threads, "
+            f"time per stage:"]
+        for name, total in seconds.most_common():
+            lines.append(
+                f"  {name:<12} {total:10.3f}s {100 * total / busy:5.1f}% "
+                f"{calls[name]:>9} calls "
+                f"{1e3 * total / max(calls[name], 1):9.3f}ms each")
+        if self.samples:
+            leaves = Counter()
+            for stack, count in self.samples.items():
+                leaves[stack.rsplit(";", 1)[-1]] += count
+            total = sum(leaves.values())
+            lines.append(f"Most sampled functions ({total} samples):")
+            for label, count in leaves.most_common(TOP_FUNCTIONS):
+                lines.append(f"  {100 * count / total:5.1f}% {label}")
+        return "\n".join(lines)
+
+
+profiler = Profiler()
@@ -1,8 +1,10 @@
-import os
-from spacetime import Node
-from utils.pcc_models import Register
+import time
+from threading import Thread
+
+from crawler.store import get_store_class
 
 def init(df, user_agent, fresh):
+    from utils.pcc_models import Register
     reg = df.read_one(Register, user_agent)
     if not reg:
         reg = Register(user_agent, fresh)
@@ -19,8 +21,49 @@ def init(df, user_agent, fresh):
             df.push()
     return reg.load_balancer
 
-def get_cache_server(config, restart):
+class Registration(object):
+    """
+    Registers with the cache server in a background thread, so the frontier
+    can load while the load balancer answers. cache_server() waits for it.
+    Whether the crawl is fresh is decided up front, before a restart removes
+    the save file, or the save files of the shards with PROCESSES above 1.
+    """
+    def __init__(self, config, restart):
+        store_class = get_store_class(config)
+        save_files = [config.save_file] + [
+            f"{config.save_file}.shard{shard}"
+            for shard in range(config.processes)]
+        self.fresh = restart or not any(
+            store_class.exists(save_file) for save_file in save_files)
+        self.result = None
+        self.error = None
+        self.seconds = None
+        self.thread = Thread(
+            target=self._register, args=(config,), name="Registration",
+            daemon=True)
+        self.thread.start()
+
+    def _register(self, config):
+        start = time.perf_counter()
+        try:
+            self.result = _start_node(config, self.fresh)
+        except BaseException as e:
+            self.error = e
+        self.seconds = time.perf_counter() - start
+
+    def cache_server(self):
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+def _start_node(config, fresh):
+    # spacetime is only needed to register, not to replay an archive.
+    from spacetime import Node
+    from utils.pcc_models import Register
     init_node = Node(
         init, Types=[Register], dataframe=(config.host, config.port))
-    return init_node.start(
-        config.user_agent, restart or not os.path.exists(config.save_file))
\ No newline at end of file
+    return init_node.start(config.user_agent, fresh)
+
+def get_cache_server(config, restart):
+    return Registration(config, restart).cache_server()
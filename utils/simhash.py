@@ -0,0 +1,107 @@
+from array import array
+from hashlib import blake2b
+from threading import Lock
+
+BITS = 64
+FIELD = 32  # bits per counter when all 64 counters are summed in one int
+FIELD_MASK = (1 << FIELD) - 1
+
+# SPREAD[b] places bit i of byte b at bit i * FIELD, so that adding spread
+# hashes adds all 64 per-bit counters at once.
+SPREAD = [
+    sum(((b >> i) & 1) << (i * FIELD) for i in range(8)) for b in range(256)]
+
+
+def token_hash(token):
+    return int.from_bytes(
+        blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def simhash(weights):
+    """
+    64-bit SimHash of a {token: weight} mapping, e.g. a Counter of words.
+    Bit i is set when the tokens whose hash has bit i set carry more than
+    half of the total weight.
+    """
+    total = 0
+    weight_sum = 0
+    for token, weight in weights.items():
+        h = token_hash(token)
+        spread = 0
+        for byte in range(8):
+            spread |= SPREAD[(h >> (byte * 8)) & 0xFF] << (byte * 8 * FIELD)
+        total += weight * spread
+        weight_sum += weight
+    fingerprint = 0
+    for i in range(BITS):
+        if 2 * ((total >> (i * FIELD)) & FIELD_MASK) > weight_sum:
+            fingerprint |= 1 << i
+    return fingerprint
+
+
+class SimHashIndex(object):
+    """
+    Finds fingerprints within Hamming distance `distance` of a new one.
+    Fingerprints are split into distance + 1 blocks; two fingerprints that
+    differ in at most `distance` bits agree on at least one block, so only
+    the entries sharing a block value are compared. Each block has its own
+    table of block value -> array of fingerprints.
+
+    At most `capacity` fingerprints are kept; the oldest is evicted first.
+    A capacity of 0 turns detection off. Thread safe.
+    """
+    def __init__(self, distance=3, capacity=1000000):
+        self.distance = distance
+        self.blocks = distance + 1
+        self.bounds = [
+            (BITS * i // self.blocks, BITS * (i + 1) // self.blocks)
+            for i in range(self.blocks)]
+        self.tables = [dict() for _ in range(self.blocks)]
+        self.capacity = capacity
+        self.ring = array("Q")  # insertion order, for eviction
+        self.next = 0
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _keys(self, fingerprint):
+        return [
+            (fingerprint >> start) & ((1 << (end - start)) - 1)
+            for start, end in self.bounds]
+
+    def _near(self, fingerprint, keys):
+        for table, key in zip(self.tables, keys):
+            for other in table.get(key, ()):
+                if bin(fingerprint ^ other).count("1") <= self.distance:
+                    return True
+        return False
+
+    def _evict(self, fingerprint):
+        for table, key in zip(self.tables, self._keys(fingerprint)):
+            bucket = table[key]
+            bucket.remove(fingerprint)
+            if not bucket:
+                del table[key]
+
+    def check_and_add(self, fingerprint):
+        """True if a near duplicate is indexed; otherwise index it."""
+        if not self.capacity:
+            return False
+        keys = self._keys(fingerprint)
+        with self.lock:
+            if self._near(fingerprint, keys):
+                self.hits += 1
+                return True
+            self.misses += 1
+            if len(self.ring) < self.capacity:
+                self.ring.append(fingerprint)
+            else:
+                self._evict(self.ring[self.next])
+                self.ring[self.next] = fingerprint
+                self.next = (self.next + 1) % self.capacity
+            for table, key in zip(self.tables, keys):
+                table.setdefault(key, array("Q")).append(fingerprint)
+            return False
+
+    def __len__(self):
+        return len(self.ring)
@@ -0,0 +1,55 @@
+import cProfile
+import io
+import os
+import pstats
+import time
+
+from utils.log_queue import LOG_DIR
+
+# Functions listed in the startup report, by cumulative time.
+TOP_FUNCTIONS = 15
+
+
+class StartupProfile(object):
+    """
+    Times the phases of launching a crawl, for --profile-startup. mark()
+    closes the phase running since the previous mark; report() logs the
+    wall time of each, and while enabled the main thread also runs under
+    cProfile, whose stats are saved to Logs/startup.prof and summarized in
+    the report. Disabled, it only reads the clock.
+    """
+    def __init__(self, enabled, started=None):
+        self.enabled = enabled
+        self.started = started if started is not None else time.perf_counter()
+        self.last = self.started
+        self.phases = list()  # (name, seconds)
+        self.profile = None
+        if enabled:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def add(self, phase, seconds):
+        """Record a phase that ran on another thread."""
+        self.phases.append((phase, seconds))
+
+    def report(self, logger):
+        if not self.enabled:
+            return
+        self.profile.disable()
+        total = self.last - self.started
+        lines = [f"Startup took {total:.3f}s:"]
+        for phase, seconds in self.phases:
+            lines.append(f"  {phase:<26} {seconds:8.3f}s")
+        os.makedirs(LOG_DIR, exist_ok=True)
+        self.profile.dump_stats(os.path.join(LOG_DIR, "startup.prof"))
+        out = io.StringIO()
+        stats = pstats.Stats(self.profile, stream=out)
+        stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+        lines.append(out.getvalue().rstrip())
+        logger.info("\n".join(lines))
+        self.profile = None
@@ -0,0 +1,253 @@
+import heapq
+import json
+import os
+import threading
+from collections import Counter, defaultdict
+
+from utils.fingerprint import FingerprintSet
+from utils.simhash import SimHashIndex
+
+
+class SpaceSaving(object):
+    """
+    Approximate top-K counts in at most `capacity` counters (the Space-Saving
+    algorithm). A word that is not tracked replaces the current minimum and
+    inherits its count, so counts are upper bounds and any word whose true
+    count exceeds total / capacity is guaranteed to be tracked.
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = dict()
+        # One (count, word) entry per tracked word; entries go stale as
+        # counts grow and are refreshed when they reach the top of the heap.
+        self.heap = list()
+
+    def update(self, counts):
+        for word, count in counts.items():
+            if word in self.counts:
+                self.counts[word] += count
+            elif len(self.counts) < self.capacity:
+                self.counts[word] = count
+                heapq.heappush(self.heap, (count, word))
+            else:
+                floor = self._pop_min()
+                self.counts[word] = floor + count
+                heapq.heappush(self.heap, (floor + count, word))
+
+    def _pop_min(self):
+        while True:
+            count, word = heapq.heappop(self.heap)
+            current = self.counts[word]
+            if current == count:
+                del self.counts[word]
+                return count
+            heapq.heappush(self.heap, (current, word))
+
+    def most_common(self, count):
+        return heapq.nlargest(count, self.counts.items(), key=lambda i: i[1])
+
+    def state(self):
+        return self.counts
+
+    @classmethod
+    def from_state(cls, capacity, counts):
+        top = cls(capacity)
+        for word, count in heapq.nlargest(
+                capacity, counts.items(), key=lambda i: i[1]):
+            top.counts[word] = count
+        top.heap = [(count, word) for word, count in top.counts.items()]
+        heapq.heapify(top.heap)
+        return top
+
+
+class _Accumulator(object):
+    """Word stats of one thread, merged into CrawlStats in batches."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.words = Counter()
+        self.longest = (0, None)
+        self.pages = 0
+
+
+class CrawlStats(object):
+    """
+    Everything create_report needs, in bounded memory:
+
+    - unique pages and exact duplicate contents as FingerprintSets,
+    - unique pages per subdomain,
+    - the longest page as a running maximum,
+    - the most common words in a SpaceSaving summary,
+    - near duplicate hits and misses.
+
+    Word stats are collected per thread and merged every `merge_every`
+    pages. Given a `save_file`, every `snapshot_every` recorded pages the
+    merged state is saved next to it and `on_snapshot()` is called, so an
+    interrupted crawl still leaves a current report, and a resumed crawl
+    continues counting from the snapshot.
+    """
+    def __init__(self, save_file=None, restart=True, snapshot_every=500,
+                 top_words=10000, near_duplicate_distance=3,
+                 near_duplicate_capacity=1000000, on_snapshot=None,
+                 merge_every=50):
+        self.save_file = save_file
+        self.snapshot_file = f"{save_file}.stats"
+        self.pages_file = f"{save_file}.pages"
+        self.contents_file = f"{save_file}.contents"
+        self.snapshot_every = snapshot_every
+        self.merge_every = merge_every
+        self.on_snapshot = on_snapshot
+
+        self.lock = threading.Lock()
+        self.snapshot_lock = threading.Lock()
+        self.local = threading.local()
+        self.accumulators = list()
+
+        self.unique_pages = FingerprintSet()
+        self.duplicate_contents = FingerprintSet()
+        self.subdomains = defaultdict(int)
+        self.top_words = top_words
+        self.words = SpaceSaving(top_words)
+        self.longest = (0, None)
+        self.pages = 0  # pages with recorded word stats
+        self.last_snapshot = 0
+        self.near_duplicates = SimHashIndex(
+            near_duplicate_distance, near_duplicate_capacity)
+        # Frontier.take_completions, set by the crawler; see _snapshot.
+        self.take_completions = None
+
+        if save_file is not None:
+            if restart:
+                self._remove_snapshot()
+            else:
+                self._load()
+
+    def admit(self, content_fingerprint, page_fingerprint, subdomain):
+        """
+        Count a downloaded page. Returns False if the exact same content was
+        seen before.
+        """
+        with self.lock:
+            if not self.duplicate_contents.add(content_fingerprint):
+                return False
+            self.unique_pages.add(page_fingerprint)
+            if subdomain:
+                self.subdomains[subdomain] += 1
+            return True
+
+    def record(self, url, word_counts, word_total):
+        """Add the words of one parsed page to this thread's accumulator."""
+        accumulator = getattr(self.local, "accumulator", None)
+        if accumulator is None:
+            accumulator = self.local.accumulator = _Accumulator()
+            with self.lock:
+                self.accumulators.append(accumulator)
+        with accumulator.lock:
+            accumulator.words.update(word_counts)
+            if word_total > accumulator.longest[0]:
+                accumulator.longest = (word_total, url)
+            accumulator.pages += 1
+            pending = accumulator.pages
+        if pending >= self.merge_every:
+            self._merge(accumulator)
+            if (self.save_file is not None and
+                    self.pages - self.last_snapshot >= self.snapshot_every):
+                # Skip if another thread is already taking the snapshot.
+                if self.snapshot_lock.acquire(blocking=False):
+                    try:
+                        self._snapshot()
+                        if self.on_snapshot:
+                            self.on_snapshot()
+                    finally:
+                        self.snapshot_lock.release()
+
+    def _merge(self, accumulator):
+        with accumulator.lock:
+            words, accumulator.words = accumulator.words, Counter()
+            longest, accumulator.longest = accumulator.longest, (0, None)
+            pages, accumulator.pages = accumulator.pages, 0
+        with self.lock:
+            self.words.update(words)
+            if longest[0] > self.longest[0]:
+                self.longest = longest
+            self.pages += pages
+
+    def merge_all(self):
+        with self.lock:
+            accumulators = list(self.accumulators)
+        for accumulator in accumulators:
+            self._merge(accumulator)
+
+    def snapshot(self):
+        if self.save_file is None:
+            self.merge_all()
+            return
+        with self.snapshot_lock:
+            self._snapshot()
+
+    def _snapshot(self):
+        # The urls marked complete so far are committed once the snapshot is
+        # written, so every page the save file has as complete is counted in
+        # the statistics a resumed crawl starts from.
+        commit = self.take_completions() if self.take_completions else None
+        self.merge_all()
+        with self.lock:
+            state = {
+                "pages": self.pages,
+                "longest": self.longest,
+                "subdomains": self.subdomains,
+                "words": self.words.state(),
+                "near_duplicate_hits": self.near_duplicates.hits,
+                "near_duplicate_misses": self.near_duplicates.misses,
+            }
+            for name, fingerprints in (
+                    (self.pages_file, self.unique_pages),
+                    (self.contents_file, self.duplicate_contents)):
+                with open(f"{name}.tmp", "wb") as f:
+                    fingerprints.dump(f)
+            with open(f"{self.snapshot_file}.tmp", "w", encoding="utf-8") as f:
+                json.dump(state, f)
+            self.last_snapshot = self.pages
+        # Replace the snapshot files together once all are written.
+        for name in (self.pages_file, self.contents_file, self.snapshot_file):
+            os.replace(f"{name}.tmp", name)
+        if commit is not None:
+            commit()
+
+    def _load(self):
+        if not os.path.exists(self.snapshot_file):
+            return
+        with open(self.snapshot_file, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        self.pages = self.last_snapshot = state["pages"]
+        self.longest = tuple(state["longest"])
+        self.subdomains.update(state["subdomains"])
+        self.words = SpaceSaving.from_state(self.top_words, state["words"])
+        self.near_duplicates.hits = state["near_duplicate_hits"]
+        self.near_duplicates.misses = state["near_duplicate_misses"]
+        with open(self.pages_file, "rb") as f:
+            self.unique_pages = FingerprintSet.load(f)
+        with open(self.contents_file, "rb") as f:
+            self.duplicate_contents = FingerprintSet.load(f)
+
+    def merge_snapshot(self, save_file):
+        """
+        Add the statistics snapshotted next to another save file, such as
+        that of a crawl shard. Word counts stay approximate.
+        """
+        other = CrawlStats(save_file, restart=False, top_words=self.top_words)
+        with self.lock:
+            self.unique_pages.update(other.unique_pages)
+            self.duplicate_contents.update(other.duplicate_contents)
+            for subdomain, count in other.subdomains.items():
+                self.subdomains[subdomain] += count
+            self.words.update(other.words.state())
+            if other.longest[0] > self.longest[0]:
+                self.longest = other.longest
+            self.pages += other.pages
+            self.near_duplicates.hits += other.near_duplicates.hits
+            self.near_duplicates.misses += other.near_duplicates.misses
+
+    def _remove_snapshot(self):
+        for name in (self.snapshot_file, self.pages_file, self.contents_file):
+            if os.path.exists(name):
+                os.remove(name)